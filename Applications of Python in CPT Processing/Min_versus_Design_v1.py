@@ -3,8 +3,6 @@
 import os
 import pandas as pd
 import numpy as np
-import geopandas as gpd
-from shapely.geometry import Point
 
 import plotly.express as px
 import plotly.graph_objects as go
@@ -14,6 +12,7 @@ pio.renderers.default='browser'
 
 #Internal
 import mappingSchemas as mapSchema
+import coordTransform
 from plottingCPT import *
 
 #################################
@@ -49,11 +48,8 @@ def clayDesignValues(df_CPT_SOIL_ALL,df):
 
 
 df_geo = clayDesignValues(df_CPT_SOIL_ALL,df)
-#Feet to meters
-df_geo[['Northing (m)','Easting (m)']] = df_geo[['Northing (ft)','Easting (ft)']] * 0.3048
-df_geo.drop(labels=['Northing (ft)','Easting (ft)'], axis=1,inplace=True)
-df_geo = gpd.GeoDataFrame(df_geo,crs = CRS, geometry = gpd.points_from_xy(df_geo['Easting (m)'],df_geo['Northing (m)']))
-df_geo_LONG_LAT = df_geo.to_crs( crs = 4326)
+#Feet to Lat/Long (cached per survey coordinates and CRS)
+df_geo_LONG_LAT = pd.concat([df_geo[['Min Su']], coordTransform.surveyLatLong(df_geo, CRS)], axis=1)
 
 #  top left, top right, bottom right, bottom left
 
@@ -70,23 +66,20 @@ with open('coordinates.txt') as f:   #Open txt file with coordinates
 
 
 
-s = gpd.GeoSeries([Point(extractCord(item)) for item in lines] , crs = 4326) # WGS84 Latitude/Longitude: EPSG:4326
+lonArr, latArr = np.array([extractCord(item) for item in lines]).T   # WGS84 Latitude/Longitude: EPSG:4326
 
 # Convert (Lon,Lat) to 2-D projection (Easting,Northing)
-s_converted = s.to_crs( crs = CRS)
+x_conv, y_conv = coordTransform.transformXY(lonArr, latArr, 4326, CRS)
 
 #Convert 2-D points from meters to feet
-x_vals = s_converted.x * 3.281
-y_vals = s_converted.y * 3.281
+x_vals = x_conv * 3.281
+y_vals = y_conv * 3.281
 
 #Bounding Box X-Y
 BBox = (min(x_vals), max(x_vals),
         min(y_vals), max(y_vals))
 
 
-df_geo_LONG_LAT['Latitude'] = df_geo_LONG_LAT['geometry'].y
-df_geo_LONG_LAT['Longitude'] = df_geo_LONG_LAT['geometry'].x
-
 ###############################################################################
 ###############################################################################
 
@@ -100,8 +93,8 @@ df_geo_LONG_LAT['Longitude'] = df_geo_LONG_LAT['geometry'].x
     
 
 arrayInterest = df_geo_LONG_LAT['Min Su'].to_numpy()
-latArray = df_geo_LONG_LAT['Latitude'] = df_geo_LONG_LAT['geometry'].y
-lonArray = df_geo_LONG_LAT['Longitude'] = df_geo_LONG_LAT['geometry'].x
+latArray = df_geo_LONG_LAT['Latitude'].to_numpy()
+lonArray = df_geo_LONG_LAT['Longitude'].to_numpy()
 cptNames = df_geo_LONG_LAT.index
 
 
@@ -0,0 +1,371 @@
+
+## BINARY, MEMORY-MAPPED COMPILED CPT DATASETS
+#
+# One-time conversion of COMPILED_CPTs.csv, COMPILED_CPTs_SOILS.csv and
+# COMPILED_CPTs_SURVEY.csv into a columnar layout partitioned by project and CPT:
+#
+#   <root>/<project>/<table>/meta.json     CPT IDs, row offsets of each CPT, column names and kinds
+#   <root>/<project>/<table>/c000.npy ...  one .npy file per column
+#
+# Rows of a CPT are contiguous, so CPT k is rows offsets[k]:offsets[k+1] of every column.
+# Text columns (Layer IDX, Layer Name, ...) are stored as integer codes plus their categories.
+# Opening a table only reads meta.json; a column is memory-mapped (mmap_mode='r') the
+# first time it is used, so an analysis only touches the columns and CPTs it reads.
+#
+#   python compiledDataset.py P17 compiled --project P17          # convert once
+#
+#   data = openDataset('compiled', ['P17', 'P18'])                 # both projects, no copy
+#   tip = data.sounding('CPT-AR-12F', ['Elevation', 'Tip Res.'])   # views into the memory maps
+#   df = data.frame(['Elevation', 'Layer IDX', 'Tip Res.'])        # text columns as pd.Categorical
+#   df = data.frame(categorical=False)                             # same frame as read_csv + concat
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from processingCPT import datasetOffsets
+
+#Table name -> compiled csv and its index columns
+COMPILED_FILES = {'cpt'    : ('COMPILED_CPTs.csv', [0,1]),
+                  'soils'  : ('COMPILED_CPTs_SOILS.csv', [0,1]),
+                  'survey' : ('COMPILED_CPTs_SURVEY.csv', 0)}
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+ROW_INDEX_FILE = 'row_index.npy'
+
+
+def _jsonable(values):
+    return [item.item() if isinstance(item, np.generic) else item for item in values]
+
+
+def writeTable(df, path):
+    """
+    Writes one compiled table (rows of each CPT contiguous)
+
+    Parameters
+        ----------
+        df : pd.DataFrame indexed by CPT ID, or by a (CPT, index) MultiIndex
+        path : str
+            Table folder, created if needed
+    """
+    os.makedirs(path, exist_ok=True)
+    cpt_ids, offsets = datasetOffsets(df)
+    multi = isinstance(df.index, pd.MultiIndex)
+    if multi:
+        if df.index.nlevels != 2:
+            raise ValueError('Compiled tables have a (CPT, index) MultiIndex')
+        np.save(os.path.join(path, ROW_INDEX_FILE), np.asarray(df.index.get_level_values(1)))
+
+    columns = []
+    for jj, name in enumerate(df.columns):
+        series = df[name]
+        entry = {'name': name, 'file': 'c%03d.npy' % jj}
+        if pd.api.types.is_bool_dtype(series.dtype) and not series.isna().any():
+            values = series.to_numpy(dtype=bool)
+            entry['kind'] = 'numeric'
+        elif pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            values = series.to_numpy()
+            if values.dtype == object:                              # Nullable extension dtypes
+                values = series.to_numpy(dtype=float, na_value=np.nan)
+            entry['kind'] = 'numeric'
+        else:
+            codes, categories = pd.factorize(series)
+            values = codes.astype(np.int16 if len(categories) < 2**15 else np.int32)
+            entry['kind'] = 'category'
+            entry['categories'] = _jsonable(categories.tolist())
+        np.save(os.path.join(path, entry['file']), values)
+        columns.append(entry)
+
+    meta = {'format': FORMAT_VERSION,
+            'index_names': list(df.index.names),
+            'row_index': multi,
+            'cpt_ids': _jsonable(cpt_ids),
+            'offsets': offsets.tolist(),
+            'columns': columns}
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    return path
+
+
+def convertProject(project_dir, out_dir, project=None, tables=None):
+    """
+    Converts the compiled csv files of one project folder
+
+    Parameters
+        ----------
+        project_dir : str
+            Folder with COMPILED_CPTs.csv, COMPILED_CPTs_SOILS.csv, COMPILED_CPTs_SURVEY.csv
+        out_dir : str
+            Dataset root, the project is written to out_dir/project
+        project : str
+            Project name (default: name of project_dir)
+        tables : list of str
+            COMPILED_FILES keys to convert (default: the ones present in project_dir)
+
+    Returns
+        -------
+        list of table folders written
+    """
+    project = project or os.path.basename(os.path.normpath(project_dir))
+    written = []
+    for table, (file_name, index_col) in COMPILED_FILES.items():
+        csv_path = os.path.join(project_dir, file_name)
+        if tables is None and not os.path.exists(csv_path):
+            continue
+        if tables is not None and table not in tables:
+            continue
+        df = pd.read_csv(csv_path, header=0, index_col=index_col)
+        written.append(writeTable(df, os.path.join(out_dir, project, table)))
+    return written
+
+
+class CompiledTable:
+    """
+    One table of one project. Columns are memory-mapped on first use and cached.
+
+    Parameters
+        ----------
+        path : str
+            Table folder written by writeTable
+    """
+
+    def __init__(self, path, project=None):
+        self.path = path
+        self.project = project
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta['format'] != FORMAT_VERSION:
+            raise ValueError('Unsupported compiled table format: ' + str(meta['format']))
+        self.index_names = meta['index_names']
+        self.cpt_ids = meta['cpt_ids']
+        self.offsets = np.asarray(meta['offsets'], dtype=np.int64)
+        self._has_row_index = meta['row_index']
+        self._meta = {entry['name']: entry for entry in meta['columns']}
+        self._position = {cpt_id: ii for ii, cpt_id in enumerate(self.cpt_ids)}
+        self._arrays = {}
+
+    @property
+    def columns(self):
+        return list(self._meta)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __contains__(self, cpt_id):
+        return cpt_id in self._position
+
+    def _array(self, file_name):
+        if file_name not in self._arrays:
+            self._arrays[file_name] = np.load(os.path.join(self.path, file_name), mmap_mode='r')
+        return self._arrays[file_name]
+
+    def rows(self, cpt_id):
+        """Row slice of one CPT"""
+        try:
+            ii = self._position[cpt_id]
+        except KeyError:
+            raise KeyError('CPT not in ' + self.path + ': ' + str(cpt_id)) from None
+        return slice(int(self.offsets[ii]), int(self.offsets[ii+1]))
+
+    def _selection(self, cpts):
+        """Row slices of the selected CPTs (all rows when cpts is None)"""
+        if cpts is None:
+            return [slice(0, len(self))]
+        return [self.rows(cpt_id) for cpt_id in cpts]
+
+    def raw(self, name, cpts=None):
+        """
+        Stored array of a column (codes for text columns). A read-only memory-map view when
+        the selection is one block of rows, a copy when several CPTs are gathered.
+        """
+        entry = self._meta[name]
+        array = self._array(entry['file'])
+        parts = [array[rows] for rows in self._selection(cpts)]
+        if not parts:
+            return array[:0]
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def column(self, name, cpts=None):
+        """Column values, text columns as a pd.Categorical over the stored codes"""
+        values = self.raw(name, cpts)
+        entry = self._meta[name]
+        if entry['kind'] == 'category':
+            return pd.Categorical.from_codes(values, categories = entry['categories'])
+        return values
+
+    def sounding(self, cpt_id, columns=None):
+        """dict column -> values of one CPT (views for numeric columns)"""
+        rows = self.rows(cpt_id)
+        out = {}
+        for name in (self.columns if columns is None else columns):
+            values = self._array(self._meta[name]['file'])[rows]
+            if self._meta[name]['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories = self._meta[name]['categories'])
+            out[name] = values
+        return out
+
+    def index(self, cpts=None):
+        """Index of the selected rows, as in the compiled csv"""
+        selection = self._selection(cpts)
+        if cpts is None:
+            level_0 = np.repeat(np.asarray(self.cpt_ids, dtype=object), np.diff(self.offsets))
+        else:
+            level_0 = np.repeat(np.asarray(list(cpts), dtype=object), [rows.stop - rows.start for rows in selection])
+        if not self._has_row_index:
+            return pd.Index(level_0, name = self.index_names[0])
+        row_index = self._array(ROW_INDEX_FILE)
+        level_1 = np.concatenate([row_index[rows] for rows in selection]) if selection else row_index[:0]
+        return pd.MultiIndex.from_arrays([level_0, level_1], names = self.index_names)
+
+    def frame(self, columns=None, cpts=None, categorical=True):
+        """
+        pd.DataFrame of the selected columns and CPTs, same layout as the compiled csv
+
+        Parameters
+            ----------
+            categorical : bool
+                        Text columns as pd.Categorical (cheap, built on the stored codes).
+                        False decodes them to the text dtype read_csv gives, missing values as NaN.
+        """
+        columns = self.columns if columns is None else list(columns)
+        data = {}
+        for name in columns:
+            values = self.column(name, cpts)
+            if not categorical and isinstance(values, pd.Categorical):
+                values = values.astype(values.categories.dtype)
+            data[name] = values
+        return pd.DataFrame(data, index = self.index(cpts), columns = columns)
+
+
+class CompiledDataset:
+    """
+    Several projects of one table seen as one dataset. Nothing is copied: CPT lookups go
+    to the memory maps of their project, only frame()/column() over several projects
+    concatenate the selected parts.
+
+    Parameters
+        ----------
+        tables : list of CompiledTable
+    """
+
+    def __init__(self, tables):
+        self.tables = list(tables)
+        self._owner = {}
+        for table in self.tables:
+            for cpt_id in table.cpt_ids:
+                if cpt_id in self._owner:
+                    raise ValueError('CPT ' + str(cpt_id) + ' is in more than one project')
+                self._owner[cpt_id] = table
+
+    @property
+    def projects(self):
+        return [table.project for table in self.tables]
+
+    @property
+    def cpt_ids(self):
+        return [cpt_id for table in self.tables for cpt_id in table.cpt_ids]
+
+    @property
+    def offsets(self):
+        """Row offsets of every CPT in the concatenated dataset"""
+        starts = np.cumsum([0] + [len(table) for table in self.tables])
+        parts = [table.offsets[:-1] + start for table, start in zip(self.tables, starts)]
+        return np.append(np.concatenate(parts) if parts else np.array([], dtype=np.int64), starts[-1])
+
+    @property
+    def columns(self):
+        """Columns present in every project"""
+        if not self.tables:
+            return []
+        common = set.intersection(*[set(table.columns) for table in self.tables])
+        return [name for name in self.tables[0].columns if name in common]
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables)
+
+    def __contains__(self, cpt_id):
+        return cpt_id in self._owner
+
+    def table(self, cpt_id):
+        """CompiledTable holding a CPT"""
+        try:
+            return self._owner[cpt_id]
+        except KeyError:
+            raise KeyError('CPT not in the dataset: ' + str(cpt_id)) from None
+
+    def sounding(self, cpt_id, columns=None):
+        return self.table(cpt_id).sounding(cpt_id, columns)
+
+    def _split(self, cpts):
+        """(table, cpts of that table or None for all) in dataset order"""
+        if cpts is None:
+            return [(table, None) for table in self.tables]
+        cpts = list(cpts)
+        if not cpts:
+            return [(self.tables[0], [])]                     # Empty selection with the columns of the first table
+        split = []
+        for cpt_id in cpts:
+            table = self.table(cpt_id)
+            if split and split[-1][0] is table:
+                split[-1][1].append(cpt_id)
+            else:
+                split.append((table, [cpt_id]))
+        return split
+
+    def column(self, name, cpts=None):
+        parts = [table.column(name, selected) for table, selected in self._split(cpts)]
+        if len(parts) == 1:
+            return parts[0]
+        if isinstance(parts[0], pd.Categorical):
+            return pd.api.types.union_categoricals(parts)
+        return np.concatenate(parts)
+
+    def frame(self, columns=None, cpts=None, categorical=True):
+        columns = self.columns if columns is None else list(columns)
+        frames = [table.frame(columns, selected, categorical) for table, selected in self._split(cpts)]
+        return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+
+def openTable(root, project, table='cpt'):
+    return CompiledTable(os.path.join(root, project, table), project)
+
+
+def openDataset(root, projects=None, table='cpt'):
+    """
+    Parameters
+        ----------
+        root : str
+            Dataset root written by convertProject
+        projects : list of str
+            Projects to open (default: every project under root having the table)
+        table : str
+            'cpt', 'soils' or 'survey'
+
+    Returns
+        -------
+        CompiledDataset
+    """
+    if projects is None:
+        projects = sorted(name for name in os.listdir(root)
+                          if os.path.exists(os.path.join(root, name, table, META_FILE)))
+    return CompiledDataset([openTable(root, project, table) for project in projects])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert compiled CPT csv files to the binary dataset format')
+    parser.add_argument('project_dir', help='Folder with the COMPILED_CPTs*.csv files')
+    parser.add_argument('out_dir', help='Dataset root')
+    parser.add_argument('--project', help='Project name (default: project_dir name)')
+    args = parser.parse_args(argv)
+    for path in convertProject(args.project_dir, args.out_dir, args.project):
+        print('Written', path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+
+## COORDINATE TRANSFORMATIONS FOR SURVEY DATA
+#
+# Reprojects raw coordinate arrays with one pyproj Transformer per CRS pair (built once
+# and reused) instead of building a GeoDataFrame of shapely Points and calling
+# to_crs(4326) on every call. Latitude / longitude of a survey table are cached by the
+# content of its coordinates and the CRS, so refreshing a map for an unchanged survey
+# does not reproject at all.
+#
+#   lon, lat = transformXY(easting_m, northing_m, 'EPSG:3466', 4326)
+#   df_latlon = surveyLatLong(df_CPT_SURVEY_ALL, 'EPSG:3466')      # Latitude, Longitude per CPT
+
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from lazyImports import lazyImport
+
+pyproj = lazyImport('pyproj')
+
+FT_TO_M = 0.3048
+LATLON_CACHE_SIZE = 64
+
+_LATLON_CACHE = OrderedDict()
+
+
+@lru_cache(maxsize=None)
+def transformer(crs_from, crs_to = 4326):
+    """pyproj Transformer between two CRS (x = easting / longitude, y = northing / latitude)"""
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def transformXY(x, y, crs_from, crs_to = 4326):
+    """
+    Reprojects coordinate arrays
+    Parameters
+        ----------
+        x, y : numeric arrays
+            Easting / northing (or longitude / latitude for EPSG:4326)
+        crs_from, crs_to : str or int
+            Any CRS accepted by pyproj, ex. 'EPSG:3466' or 4326
+
+    Returns
+        -------
+        (x, y) np.arrays in crs_to, NaN where the input is not finite
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    x_out, y_out = transformer(crs_from, crs_to).transform(x, y)
+    finite = np.isfinite(x) & np.isfinite(y)
+    return np.where(finite, x_out, np.nan), np.where(finite, y_out, np.nan)
+
+
+def surveyKey(northing, easting, index, CRS):
+    """Cache key of a survey: hash of the CPT IDs and coordinates plus the CRS"""
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(pd.Index(index), index=False).to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(northing, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(easting, dtype=float).tobytes())
+    return digest.hexdigest(), str(CRS)
+
+
+def surveyLatLong(df, CRS = 'EPSG:3466', cache = True):
+    """
+    Latitude and longitude of every CPT of a survey table (coordinates in feet)
+    Parameters
+        ----------
+        df : pd.DataFrame with 'Northing (ft)' and 'Easting (ft)', CPT ID as the index
+        CRS : str
+            CRS of the survey coordinates
+        cache : bool
+            Reuse the result of an earlier call with the same coordinates and CRS
+
+    Returns
+        -------
+        pd.DataFrame with Latitude and Longitude, index of df
+    """
+    northing = df['Northing (ft)'].to_numpy(dtype=float)
+    easting = df['Easting (ft)'].to_numpy(dtype=float)
+    key = surveyKey(northing, easting, df.index, CRS) if cache else None
+    if key in _LATLON_CACHE:
+        _LATLON_CACHE.move_to_end(key)
+        latlon = _LATLON_CACHE[key]
+    else:
+        lon, lat = transformXY(easting * FT_TO_M, northing * FT_TO_M, CRS, 4326)
+        latlon = np.column_stack([lat, lon])
+        latlon.flags.writeable = False
+        if cache:
+            _LATLON_CACHE[key] = latlon
+            if len(_LATLON_CACHE) > LATLON_CACHE_SIZE:
+                _LATLON_CACHE.popitem(last=False)
+    return pd.DataFrame(latlon.copy(), index = df.index.copy(), columns = ['Latitude', 'Longitude'])
+
+
+def clearCache():
+    """Drops the cached survey coordinates and transformers"""
+    _LATLON_CACHE.clear()
+    transformer.cache_clear()
@@ -0,0 +1,40 @@
+
+## LAZY IMPORTS FOR OPTIONAL DEPENDENCIES
+#
+# plotly, geopandas and mapclassify are only needed for plotting and mapping.
+# Modules bind them with lazyImport so that importing the module is cheap and works
+# without those packages; the real import happens on first attribute access.
+#
+#   go = lazyImport('plotly.graph_objects')
+#   fig = go.Figure()            # plotly.graph_objects is imported here
+
+import importlib
+
+
+class LazyModule:
+    """Module proxy, imports the module the first time one of its attributes is used"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as err:
+                raise ImportError(self._name + ' is required for this function (' + str(err) + ')') from err
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return '<lazy module ' + self._name + ' (' + state + ')>'
+
+
+def lazyImport(name):
+    return LazyModule(name)
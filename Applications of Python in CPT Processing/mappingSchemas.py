@@ -2,8 +2,11 @@
 
 import numpy as np
 import pandas as pd
-import mapclassify as mc
-import plotly
+from lazyImports import lazyImport
+
+#Loaded on first use
+mc = lazyImport('mapclassify')
+plotly = lazyImport('plotly')
 
        
 def classiSchema(arr, mode = 'Equal_Interval', **kwargs):
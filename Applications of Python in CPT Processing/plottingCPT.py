@@ -1,10 +1,16 @@
-import plotly
 import ast
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.express as px
 import numpy as np
 import processingCPT
+from lazyImports import lazyImport
+
+#plotly is loaded on the first plot, not on import
+plotly = lazyImport('plotly')
+go = lazyImport('plotly.graph_objects')
+px = lazyImport('plotly.express')
+_subplots = lazyImport('plotly.subplots')
+
+def make_subplots(*args, **kwargs):
+    return _subplots.make_subplots(*args, **kwargs)
 
 """This module has (3) functions and (1) global variable
 
@@ -1,8 +1,9 @@
 
 import pandas as pd
 import numpy as np
-import geopandas as gpd
-from shapely.geometry import Point
+
+#Reprojection through cached pyproj transformers (pyproj is only loaded when used)
+import coordTransform
 
 """The functions in this module should all return a DF with at least three columns:
         ['Array of Interest', 'Latitude', 'Longitude'].
@@ -30,16 +31,9 @@ def minimumClayDesignStrength(df_CPT_SURVEY_ALL,df_CPT_SOIL_ALL,CRS):
     
     df_geo = clayDesignValues(df_CPT_SOIL_ALL,df)
     
-    #Feet to meters
-    df_geo[['Northing (m)','Easting (m)']] = df_geo[['Northing (ft)','Easting (ft)']] * 0.3048
-    df_geo.drop(labels=['Northing (ft)','Easting (ft)'], axis=1,inplace=True)
-    df_geo = gpd.GeoDataFrame(df_geo,crs = CRS, geometry = gpd.points_from_xy(df_geo['Easting (m)'],df_geo['Northing (m)']))
-    df_geo_LONG_LAT = df_geo.to_crs( crs = 4326)
-    
-    #  top left, top right, bottom right, bottom left
-    df_geo_LONG_LAT['Latitude'] = df_geo_LONG_LAT['geometry'].y
-    df_geo_LONG_LAT['Longitude'] = df_geo_LONG_LAT['geometry'].x
-    df_geo_LONG_LAT = df_geo_LONG_LAT.loc[:,['Min Su','Latitude','Longitude']]
+    #Feet to Lat/Long, cached per survey coordinates and CRS
+    df_latlon = coordTransform.surveyLatLong(df_geo, CRS)
+    df_geo_LONG_LAT = pd.concat([df_geo[['Min Su']], df_latlon], axis=1)
     
     return df_geo_LONG_LAT
 
@@ -47,28 +41,17 @@ def minimumClayDesignStrength(df_CPT_SURVEY_ALL,df_CPT_SOIL_ALL,CRS):
 def NE_to_Lat_long(df, CRS = 'EPSG:3466'):
     
     """
-    df: DataFrame with at least 
+    df: DataFrame with at least 'Northing (ft)' and 'Easting (ft)', CPT ID as the index
+    Returns a DataFrame with two columns (Latitude, Longitude), cached per coordinates and CRS
         """
     
-    df[['Northing (m)','Easting (m)']] = df[['Northing (ft)','Easting (ft)']] * 0.3048
-    df = df[['Northing (m)','Easting (m)']]
-    df = gpd.GeoDataFrame(df,crs = CRS, geometry = gpd.points_from_xy(df['Easting (m)'],df['Northing (m)']))
-    df_geo = df.to_crs( crs = 4326)
-     
-    df_geo['Latitude'] = df_geo['geometry'].y
-    df_geo['Longitude'] = df_geo['geometry'].x
-
-    df_geo = df_geo.loc[:,['Latitude','Longitude']]
-    return df_geo
+    return coordTransform.surveyLatLong(df, CRS)
 
 def mapIdentifier(df, df_survey, layer, parameter, value, elevation, boundType, targetThickness):
 
-    "This function  retruns a n x 3 DataFrame with [Boolean_array , Lat , Long] "
-    
-    def geoBoolean(df, layer, parameter, value, elevation, boundType, targetThickness):
-
-        """Parameters
-        df : pd.DataFrame CPT Output df for CPT
+    """This function  retruns a n x 3 DataFrame with [Boolean_array , Lat , Long]
+        Parameters
+        df : pd.DataFrame CPT Output df with a (CPT, index) MultiIndex
         layer : STR  ex. 'CCR,Sand 1'
         parameter : STR   MUST be a column of df
         value : float
@@ -77,25 +60,82 @@ def mapIdentifier(df, df_survey, layer, parameter, value, elevation, boundType,
         targetThickness : float
         """
 
-        filt_1 = df['Layer IDX'] == layer
-        elev_arr = [float(item) for item in elevation.strip('[]').split(',')]
-        filt_2 = df['Elevation'].between(elev_arr[0],elev_arr[1])
+    criteria = [{'name': parameter+'_bool', 'layer': layer, 'parameter': parameter, 'value': value,
+                 'elevation': elevation, 'boundType': boundType, 'targetThickness': targetThickness}]
+    return mapIdentifierBatch(df, df_survey, criteria)
 
-        if boundType == 'Upper Bound':
-            filt_3 = df[parameter] <= value
-        else:
-            filt_3 = df[parameter] >= value
 
-        df = df[filt_1 & filt_2 & filt_3]
+CRITERIA_COLUMNS = ['layer', 'parameter', 'value', 'elevation', 'boundType', 'targetThickness']
+
+
+def elevationRange(elevation):
+    """(bottom, top) from an elevation range given as '[10,15]' or as a pair of numbers"""
+    if isinstance(elevation, str):
+        elevation = elevation.strip('[]').split(',')
+    bottom, top = [float(item) for item in elevation]
+    return bottom, top
+
+
+def mapIdentifierBatch(df, df_survey, criteria, spacing = 0.065, fraction = 0.9, CRS = 'EPSG:3466'):
+
+    """
+    mapIdentifier for many criteria at once: a CPT meets a criterion when its samples of
+    the layer, inside the elevation range and within the bound add up to more than
+    fraction * targetThickness (samples * spacing).
+    Every criterion is a mask over all the rows of df; the masks are counted per CPT with
+    one bincount, so there is no groupby or per-CPT copy of the frame.
+    Parameters
+        ----------
+        df : pd.DataFrame with a (CPT, index) MultiIndex, rows in any order
+        df_survey : pd.DataFrame with 'Northing (ft)' and 'Easting (ft)', CPT ID as the index
+        criteria : pd.DataFrame or list of dicts with CRITERIA_COLUMNS (the mapIdentifier
+            arguments) and an optional 'name' used as the result column. elevation is
+            '[10,15]' or (10, 15).
+        spacing : float
+            Thickness represented by one sample
+        fraction : float
+        CRS : str
+            CRS of the survey coordinates
+
+    Returns
+        -------
+        pd.DataFrame with one boolean column per criterion plus Latitude and Longitude,
+        CPT ID as the index
+    """
+    criteria = pd.DataFrame(criteria)
+    missing = set(CRITERIA_COLUMNS) - set(criteria.columns)
+    if missing:
+        raise ValueError('Missing criteria columns: ' + str(sorted(missing)))
+    names = list(criteria['name']) if 'name' in criteria.columns else list(criteria.index)
+
+    sounding, cpt_ids = pd.factorize(df.index.get_level_values(0))     # -1 for a missing CPT ID
+    elev = df['Elevation'].to_numpy(dtype=float)
+    layer_codes, layer_names = pd.factorize(df['Layer IDX'])
+    layer_lookup = {name: code for code, name in enumerate(layer_names)}
+    columns = {parameter: df[parameter].to_numpy(dtype=float) for parameter in criteria['parameter'].unique()}
+
+    #(rows x criteria) mask, NaN values never meet a criterion
+    mask = np.zeros((len(df), len(criteria)), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for jj, crit in enumerate(criteria.itertuples(index=False)):
+            bottom, top = elevationRange(crit.elevation)
+            values = columns[crit.parameter]
+            in_bound = values <= crit.value if crit.boundType == 'Upper Bound' else values >= crit.value
+            mask[:, jj] = (layer_codes == layer_lookup.get(crit.layer, -2)) & (elev >= bottom) & (elev <= top) & in_bound
+    mask[sounding < 0] = False
+
+    #Samples per (CPT, criterion) from one bincount of the flattened mask
+    row, col = np.nonzero(mask)
+    n_criteria = len(criteria)
+    samples = np.bincount(sounding[row] * n_criteria + col,
+                          minlength=len(cpt_ids) * n_criteria).reshape(len(cpt_ids), n_criteria)
+    thickness = criteria['targetThickness'].to_numpy(dtype=float)
+    meets = samples * spacing > fraction * thickness
+
+    df_bool = pd.DataFrame(meets, index = pd.Index(cpt_ids, name = df.index.names[0]), columns = names).sort_index()
+    df_geo = NE_to_Lat_long(df_survey, CRS)  #DF with two columns (Latitude, Longitude) and CPT ID as the index
+    return pd.concat([df_bool, df_geo], axis = 1, join = 'inner')
 
-        return len(df) * 0.065 > 0.9 * targetThickness   
-    
-    boolSeries = df.groupby(level = 0).apply(geoBoolean, layer, parameter, value, elevation, boundType, targetThickness)
-    boolSeries.name = parameter+'_bool'
-    df_geo = NE_to_Lat_long(df_survey)  #DF with two columns (Latitude, Longitude) and CPT ID as the index
-    df_bool = pd.concat([boolSeries, df_geo ], axis = 1, join = 'inner')
-     
-    return df_bool
 
 
 
@@ -113,14 +153,144 @@ def filterCPT(arr, filterMode, wSize = 11):
         option : 'median or average'
             Filtering option (default is 'median')
     """
-    if filterMode == 'Rolling Median':
-        f = lambda x : pd.Series(arr).rolling(wSize,center=True,min_periods=1).median()
-    elif filterMode == 'Rolling Average':
-        f = lambda x : pd.Series(arr).rolling(wSize,center=True,min_periods=1).mean()
-    else:
+    return filterCPTcolumns(arr, filterMode, wSize)
+
+
+#Widest window filtered by sorting every window, wider medians use the pandas skip list
+MEDIAN_SORT_MAX_WINDOW = 31
+
+
+def filterCPTcolumns(arr, filterMode = 'Rolling Median', wSize = 11, offsets = None, chunkSize = 2**16):
+
+    """
+    Centered rolling median / mean of every column of a 2D array in one pass.
+    Same output as pd.Series.rolling(wSize, center=True, min_periods=1) per column:
+    NaN values are skipped and the windows are truncated at the ends of each sounding.
+    Soundings are separated by NaN padding so no window crosses into the next one.
+    Means and valid counts are cumsum differences over windows clipped to each sounding (O(n)).
+    Medians of windows up to MEDIAN_SORT_MAX_WINDOW rows sort each window (NaN last) and
+    read the middle of its valid values, O(n * wSize * log(wSize)) but faster than pandas
+    for the usual CPT windows. Wider windows use the running median of pandas (sliding
+    sorted skip list, O(n * log(wSize))) over the padded array, the padding keeps the
+    soundings apart.
+    Parameters
+        ----------
+        arr : numeric array (n,) or (n, columns)
+            Values to be filtered, ex. qc and fs side by side
+        filterMode : 'Rolling Median' or 'Rolling Average'
+        wSize : int
+            Rolling window size
+        offsets : int array
+            Sounding boundaries of concatenated soundings, sounding k is rows
+            offsets[k]:offsets[k+1]. None treats the array as one sounding.
+        chunkSize : int
+            Rows filtered at a time (bounds the memory of the gathered windows)
+
+    Returns
+        -------
+        np.array with the shape of arr
+    """
+    if filterMode not in ('Rolling Median', 'Rolling Average'):
         raise ValueError('Provide filtering method')
-    
-    return f(arr).to_numpy()
+    wSize = int(wSize)
+    if wSize < 1:
+        raise ValueError('Window size must be at least 1')
+
+    values = np.asarray(arr, dtype=float)
+    one_column = values.ndim == 1
+    n_rows = values.shape[0]
+    offsets = checkOffsets(offsets, n_rows)
+    if values.size == 0:
+        return values.copy()
+    values = values.reshape(n_rows, -1)
+    n_cols = values.shape[1]
+
+    #Window of row i is [i - left, i + right], same alignment as pandas center=True
+    left = wSize // 2
+    right = wSize - 1 - left
+    pad = max(left, right)
+
+    lengths = np.diff(offsets)
+    sounding = np.repeat(np.arange(len(lengths)), lengths)
+
+    if filterMode == 'Rolling Average':
+        #Interior windows are differences of two cumsum slices; only rows within half a window
+        #of a sounding end get bounds clipped to their sounding. Deviations from the column
+        #mean keep the running sum small (less cancellation).
+        edge = np.concatenate([offsets[:-1, None] + np.arange(left)[None, :],
+                               offsets[1:, None] - 1 - np.arange(right)[None, :]], axis=1)
+        edge_sounding = np.repeat(np.arange(len(lengths)), left + right)
+        edge = edge.ravel()
+        inside = (edge >= offsets[:-1][edge_sounding]) & (edge < offsets[1:][edge_sounding])
+        edge, edge_sounding = edge[inside], edge_sounding[inside]
+        edge_lo = np.maximum(edge - left, offsets[:-1][edge_sounding])
+        edge_hi = np.minimum(edge + right + 1, offsets[1:][edge_sounding])
+
+        def windowSums(x, total):
+            cum = np.zeros(n_rows + 1, dtype=x.dtype)
+            np.cumsum(x, out=cum[1:])
+            if n_rows >= wSize:
+                np.subtract(cum[wSize:], cum[:n_rows+1-wSize], out=total[left:n_rows-right])
+            total[edge] = cum[edge_hi] - cum[edge_lo]
+            return total
+
+        out = np.empty((n_rows, n_cols))
+        for jj in range(n_cols):
+            x = values[:, jj]
+            valid = ~np.isnan(x)
+            total = np.empty(n_rows)
+            if valid.all():
+                center = x.mean()
+                count = np.full(n_rows, wSize)
+                count[edge] = edge_hi - edge_lo
+                windowSums(x - center, total)
+            else:
+                center = x[valid].mean() if valid.any() else 0.0
+                count = windowSums(valid.astype(np.int64), np.empty(n_rows, dtype=np.int64))
+                windowSums(np.where(valid, x - center, 0.0), total)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                total /= count
+            total += center
+            total[count == 0] = np.nan
+            out[:, jj] = total
+        return out[:, 0] if one_column else out
+
+    #Soundings laid out with pad NaN rows before, between and after them
+    position = np.arange(n_rows) + pad * (sounding + 1)
+    padded = np.full((n_rows + pad * (len(lengths) + 1), n_cols), np.nan)
+    padded[position] = values
+    first = position - left                                   # First padded row of each window
+
+    #Valid values per window from a cumsum difference
+    valid = ~np.isnan(padded)
+    cum_count = np.zeros((len(padded) + 1, n_cols), dtype=np.int64)
+    np.cumsum(valid, axis=0, out=cum_count[1:])
+    count = cum_count[first + wSize] - cum_count[first]
+
+    if wSize > MEDIAN_SORT_MAX_WINDOW:
+        out = pd.DataFrame(padded).rolling(wSize, center=True, min_periods=1).median().to_numpy()[position]
+        return out[:, 0] if one_column else out
+
+    windows = np.lib.stride_tricks.sliding_window_view(padded, wSize, axis=0)   # (rows, columns, wSize) view
+    out = np.empty((n_rows, n_cols))
+    for start in range(0, n_rows, chunkSize):
+        stop = min(start + chunkSize, n_rows)
+        win = windows[first[start:stop]]                       # Gathered copy (chunk, columns, wSize)
+        win.sort(axis=-1)                                      # NaN sorted last
+        result = (win[..., (wSize - 1) // 2] + win[..., wSize // 2]) / 2
+
+        #Windows truncated by the sounding ends or holding NaN: middle of their valid values
+        n_valid = count[start:stop]
+        short = n_valid < wSize
+        if short.any():
+            row, col = np.nonzero(short)
+            k = n_valid[short]
+            lo = win[row, col, np.maximum((k - 1) // 2, 0)]
+            hi = win[row, col, np.minimum(k // 2, wSize - 1)]
+            result[short] = np.where(k > 0, (lo + hi) / 2, np.nan)
+        out[start:stop] = result
+
+    return out[:, 0] if one_column else out
 
 
 def filterCPT_settle3d(tip_arr,depth_arr, elev, widthSize = 0.88, BS = 1, **kwargs):
@@ -129,59 +299,260 @@ def filterCPT_settle3d(tip_arr,depth_arr, elev, widthSize = 0.88, BS = 1, **kwar
     Algorithm taken from Settle3D. Refer to README file for the reference.
     Parameters
         ----------
-        CPT_file : str   (filename)
-            Filename to be loaded
+        tip_arr : numeric array
+            Values to be filtered
+        depth_arr : numeric array
+            Depth of each value
+        elev : numeric array
+            Elevation of each value (returned for the kept rows)
+        widthSize : float
+            Window size
+        BS : float
+            Bandwidth size, in standard deviations
+    """
+    mask = settle3dMask(tip_arr, depth_arr, widthSize, BS)
+    x = np.asarray(tip_arr, dtype=float)[mask]
+    y = np.asarray(elev)[mask]
+    return (x,y)
+
+
+def settle3dMask(tip_arr, depth_arr, widthSize = 0.88, BS = 1):
+    """
+    Settle3D bandwidth filter as a boolean mask aligned with the input (True = kept).
+    Per-bin mean/std come from np.bincount reductions and the neighbour sigmas from
+    shifting the per-bin arrays, so the cost is O(n) with no DataFrame, groupby or merge.
+    Same bins as DepthCategory ([left, right) intervals, last bin extended to the
+    maximum depth) and same rules as the groupby implementation: only bins with data
+    are neighbours, std with ddof = 1, NaN thresholds drop the rows.
+    Parameters
+        ----------
+        tip_arr : numeric array
+            Values to be filtered
+        depth_arr : numeric array
+            Depth of each value
         widthSize : float
             Window size
+        BS : float
+            Bandwidth size, in standard deviations
     """
+    x = np.asarray(tip_arr, dtype=float)
+    depth = np.asarray(depth_arr, dtype=float)
+    mask = np.zeros(x.shape, dtype=bool)
+
+    edges = depthBinEdges(depth, widthSize)
+    n_bins = len(edges) - 1
+    if n_bins < 1:
+        return mask
+
+    code = np.searchsorted(edges, depth, side='right') - 1          # Left-closed bins
+    in_bin = (code >= 0) & (code < n_bins)                           # NaN depths fall outside
+    if not in_bin.any():
+        return mask
+
+    #Only bins holding rows take part (empty bins are not neighbours), renumber them 0..n_bins-1
+    observed = np.bincount(code[in_bin], minlength=n_bins) > 0
+    renumber = np.cumsum(observed) - 1
+    n_bins = int(observed.sum())
+    code = np.where(in_bin, renumber[np.where(in_bin, code, 0)], 0)
+
+    #Per-bin mean and variance (NaN values are skipped as in groupby)
+    valid = in_bin & ~np.isnan(x)
+    count = np.bincount(code[valid], minlength=n_bins)
+    total = np.bincount(code[valid], weights=x[valid], minlength=n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        dev = x[valid] - mean[code[valid]]
+        var = np.bincount(code[valid], weights=dev*dev, minlength=n_bins) / (count - 1)
+    var[count < 2] = np.nan
+
+    #Sigma with the next bin (sigma_bi) and with the previous bin (sigma_ai)
+    var_next = np.append(var[1:], np.nan)
+    var_prev = np.insert(var[:-1], 0, np.nan)
+    sigma_bi = np.sqrt(var + var_next)
+    sigma_ai = np.sqrt(var + var_prev)
+
+    band = np.where(sigma_ai <= sigma_bi, mean + BS * sigma_ai, mean + BS * sigma_bi)
+    band[0] = mean[0] + BS * sigma_bi[0]                             # First and last bins only have one neighbour
+    band[-1] = mean[-1] + BS * sigma_ai[-1]
+
+    with np.errstate(invalid='ignore'):
+        mask = in_bin & (x <= band[code])
+    return mask
+
+
+def checkOffsets(offsets, n_rows):
+    """Sounding offsets as an int array from 0 to n_rows (None is a single sounding)"""
+    if offsets is None:
+        return np.array([0, n_rows], dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) < 1 or offsets[0] != 0 or offsets[-1] != n_rows or np.any(np.diff(offsets) < 0):
+        raise ValueError('Offsets must go from 0 to the number of rows')
+    return offsets
+
+
+def datasetOffsets(df):
+    """
+    CPT IDs and sounding offsets of a compiled dataset (COMPILED_CPTs.csv read with
+    index_col=[0,1]), sounding k is rows offsets[k]:offsets[k+1].
+    Parameters
+        ----------
+        df : pd.DataFrame with a (CPT, index) MultiIndex, rows of each CPT contiguous
 
-    #Read Raw Data & get Categorical column based on window size
-    #= readCPT(CPT)    # #Depth, qc, qt, fs, u2,
+    Returns
+        -------
+        (list of CPT IDs, int array of len(CPT IDs) + 1 offsets)
+    """
+    if len(df) == 0:
+        return [], np.array([0], dtype=np.int64)
+    cpt_ids = df.index.get_level_values(0)
+    codes = pd.factorize(cpt_ids)[0]
+    start = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    if len(start) != codes.max() + 1:
+        raise ValueError('Rows of each CPT must be contiguous, sort the index first')
+    return list(cpt_ids[start]), np.append(start, len(df)).astype(np.int64)
 
-    catArray = DepthCategory(depth_arr,widthSize)
 
-    raw = pd.DataFrame([tip_arr, depth_arr,catArray, elev]).T
-    raw.columns = ['x','Depth','Category','Elevation']  
-    
-    df = raw.groupby('Category').agg({'x' : [np.mean,np.std]})    #Groupby based on depth interval
-    df.columns = ['x_mean','x_std']                                   #Multindex to single index
-    df.reset_index(inplace=True)            
-
-    #Calculating Sigma_bi and Sigma_ai
-    #Calculate Sigma_bi
-    df_shifted_up = df.copy()
-    df_shifted_up.index -= 1
-    sigma_bi = (df['x_std']**2 +  df_shifted_up['x_std']**2)**0.5
-    df['sigma_bi'] = sigma_bi
-
-    #Calculate Sigma_ai
-    df_shifted_down = df.copy()
-    df_shifted_down.index += 1
-    sigma_ai = (df['x_std']**2 +  df_shifted_down['x_std']**2)**0.5
-    df['sigma_ai'] = sigma_ai
-    df.head(10)
-
-    #Uncomment to understand the INDEX SHIFT
-    #pd.concat([df['Category'],df_shifted_up['Category'],df_shifted_down['Category']],axis=1,
-    #     keys= ['Original','Next_interval','Previous Interval']).dropna(subset=['Original'])
-
-    #FILTERING
-    df['Bandwith'] = 'NA'                    #columns Category	qc_mean	qc_std	sigma_bi	sigma_ai	Bandwith
-    filt = df['sigma_ai'] <= df['sigma_bi']
-    df.loc[filt,'Bandwith'] = df['x_mean'] + BS * sigma_ai
-    df.loc[~filt,'Bandwith'] = df['x_mean'] + BS * sigma_bi
-
-    #Fix first and last row - First row to have
-    df.loc[0,'Bandwith'] = df.loc[0,'x_mean'] + BS * df.loc[0,'sigma_bi']
-    df.loc[df.index[-1],'Bandwith'] = df.loc[df.index[-1],'x_mean'] + BS * df.loc[df.index[-1],'sigma_ai']
-
-    #MERGING
-    raw_data_merged = pd.merge(raw,df,on='Category',validate = 'm:1')
-    filtered_CPT_data = raw_data_merged.copy()
-    filtered_CPT_data = filtered_CPT_data.query('x <= Bandwith')
-    x = filtered_CPT_data['x'].to_numpy()
-    y = filtered_CPT_data['Elevation'].to_numpy()
-    return (x,y)
+def settle3dMaskSegments(tip_arr, depth_arr, offsets, widthSize = 0.88, BS = 1):
+    """
+    settle3dMask of every sounding of concatenated soundings in one call.
+    Bins are numbered per sounding (floor(depth / widthSize), checked against the
+    DepthCategory edges of the sounding) and the per-bin statistics of all soundings come
+    from the same bincount reductions; neighbour bins never cross a sounding boundary.
+    Parameters
+        ----------
+        tip_arr : numeric array (n,) or (n, columns)
+            Values to be filtered, each column is filtered on its own
+        depth_arr : numeric array (n,)
+            Depth of each row
+        offsets : int array
+            Sounding boundaries, sounding k is rows offsets[k]:offsets[k+1]
+        widthSize : float
+            Window size
+        BS : float
+            Bandwidth size, in standard deviations
+
+    Returns
+        -------
+        boolean mask with the shape of tip_arr (True = kept)
+    """
+    values = np.asarray(tip_arr, dtype=float)
+    one_column = values.ndim == 1
+    depth = np.asarray(depth_arr, dtype=float)
+    offsets = checkOffsets(offsets, len(depth))
+    if values.size == 0:
+        return np.zeros(values.shape, dtype=bool)
+    values = values.reshape(len(values), -1)
+    lengths = np.diff(offsets)
+    n_soundings = len(lengths)
+    sounding = np.repeat(np.arange(n_soundings), lengths)
+    mask = np.zeros(values.shape, dtype=bool)
+
+    #Bins of each sounding from its maximum depth, same edges as depthBinEdges
+    max_depth = np.full(n_soundings, np.nan)
+    np.fmax.at(max_depth, sounding, depth)
+    n_bins = np.zeros(n_soundings, dtype=np.int64)
+    top_edge = np.full(n_soundings, np.nan)
+    for ii, max_val in enumerate(max_depth):
+        edges = depthBinEdges([max_val], widthSize)
+        if len(edges) > 1:
+            n_bins[ii] = len(edges) - 1
+            top_edge[ii] = edges[-1]
+
+    #Left-closed bins: edges are k * widthSize (as np.arange), the last bin ends at the top edge
+    with np.errstate(invalid='ignore'):
+        code = np.floor(depth / widthSize)
+        code[depth < code * widthSize] -= 1
+        code[depth >= (code + 1) * widthSize] += 1
+        in_bin = (code >= 0) & (depth < top_edge[sounding]) & (n_bins[sounding] > 0)
+    if not in_bin.any():
+        return mask[:, 0] if one_column else mask
+    code = np.minimum(np.where(in_bin, code, 0).astype(np.int64), n_bins[sounding] - 1)
+
+    #Only bins holding rows take part, renumbered over the whole dataset
+    bin_start = np.concatenate([[0], np.cumsum(n_bins)])
+    global_bin = np.where(in_bin, bin_start[sounding] + code, 0)
+    observed = np.bincount(global_bin[in_bin], minlength=bin_start[-1]) > 0
+    renumber = np.cumsum(observed) - 1
+    bin_sounding = np.repeat(np.arange(n_soundings), n_bins)[observed]
+    n_total = len(bin_sounding)
+    code = np.where(in_bin, renumber[global_bin], 0)
+
+    first_bin = np.r_[True, bin_sounding[1:] != bin_sounding[:-1]]
+    last_bin = np.r_[bin_sounding[1:] != bin_sounding[:-1], True]
+
+    for jj in range(values.shape[1]):
+        x = values[:, jj]
+        valid = in_bin & ~np.isnan(x)
+        count = np.bincount(code[valid], minlength=n_total)
+        total = np.bincount(code[valid], weights=x[valid], minlength=n_total)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+            dev = x[valid] - mean[code[valid]]
+            var = np.bincount(code[valid], weights=dev*dev, minlength=n_total) / (count - 1)
+        var[count < 2] = np.nan
+
+        #Neighbours inside the same sounding only
+        var_next = np.where(last_bin, np.nan, np.append(var[1:], np.nan))
+        var_prev = np.where(first_bin, np.nan, np.insert(var[:-1], 0, np.nan))
+        sigma_bi = np.sqrt(var + var_next)
+        sigma_ai = np.sqrt(var + var_prev)
+
+        band = np.where(sigma_ai <= sigma_bi, mean + BS * sigma_ai, mean + BS * sigma_bi)
+        band[first_bin] = mean[first_bin] + BS * sigma_bi[first_bin]
+        band[last_bin] = mean[last_bin] + BS * sigma_ai[last_bin]
+
+        with np.errstate(invalid='ignore'):
+            mask[:, jj] = in_bin & (x <= band[code])
+
+    return mask[:, 0] if one_column else mask
+
+
+def filterDataset(df, columns, filterMode = 'Rolling Median', wSize = 11, widthSize = 0.88, BS = 1,
+                  depthColumn = 'Depth'):
+    """
+    Filters columns of every CPT of a compiled dataset in one call, ex. P17 and P18
+    concatenated: filterDataset(pd.concat([df_P17, df_P18]), ['Tip Res.', 'Sleeve Friction'])
+    Parameters
+        ----------
+        df : pd.DataFrame with a (CPT, index) MultiIndex (see datasetOffsets)
+        columns : str or list of str
+            Columns to be filtered
+        filterMode : 'Rolling Median', 'Rolling Average' or 'Settle3D'
+        wSize : int
+            Rolling window size (rolling modes)
+        widthSize, BS : float
+            Settle3D window size and bandwidth (rows dropped by Settle3D are NaN)
+        depthColumn : str
+            Depth column used by Settle3D
+
+    Returns
+        -------
+        pd.DataFrame with the filtered columns, aligned with df
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    offsets = datasetOffsets(df)[1]
+    values = df[columns].to_numpy(dtype=float)
+
+    if filterMode == 'Settle3D':
+        mask = settle3dMaskSegments(values, df[depthColumn].to_numpy(dtype=float), offsets, widthSize, BS)
+        filtered = np.where(mask, values, np.nan)
+    else:
+        filtered = filterCPTcolumns(values, filterMode, wSize, offsets)
+
+    return pd.DataFrame(filtered, index = df.index, columns = columns)
+
+
+def depthBinEdges(depth_array, step=5):
+    """Interval edges used by DepthCategory (the last interval is extended to the maximum depth)"""
+    depth = np.asarray(depth_array, dtype=float)
+    depth = depth[~np.isnan(depth)]
+    max_val = depth.max() if depth.size else np.nan
+    if not max_val > 0:
+        return np.array([])
+    dz = list(np.arange(0,max_val,step))
+    if max_val not in dz:
+        dz[-1] = round( max_val + 0.001 ,4)
+    return np.array(dz, dtype=float)
 
 
 def DepthCategory(depth_array,step=5,int_type='left'):
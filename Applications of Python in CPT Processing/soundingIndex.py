@@ -0,0 +1,135 @@
+
+## SOUNDING INDEX FOR CPT-ID AND ELEVATION-RANGE QUERIES
+#
+# Replaces df.loc[cptID, column] on the (CPT, index) MultiIndex frame and
+# df.loc[cptID, 'Elevation'].between(elev1, elev2) in tight loops over CPTs.
+# Columns are copied once into contiguous arrays, each sounding sorted by elevation
+# (ascending, NaN last); a sounding is a slice of every array, found with a dict
+# lookup, and an elevation range is two searchsorted calls on that slice.
+# Everything returned is a view into the index arrays (read-only).
+#
+#   index = SoundingIndex.fromFrame(df, ['Elevation', 'Layer IDX', 'Tip Res.'])
+#   tip = index.get('CPT-AR-12F', 'Tip Res.')                  # df.loc['CPT-AR-12F', 'Tip Res.']
+#   rows = index.between('CPT-AR-12F', 7.5, 8.5)              # dict column -> view, Elevation in [7.5, 8.5]
+
+import numpy as np
+import pandas as pd
+
+from processingCPT import datasetOffsets
+
+
+class SoundingIndex:
+    """
+    Parameters
+        ----------
+        columns : dict column -> array
+            Rows of each CPT contiguous, in the order of cpt_ids
+        cpt_ids : list
+        offsets : int array
+            CPT k is rows offsets[k]:offsets[k+1]
+        elevationColumn : str
+            Column the soundings are sorted by
+    """
+
+    def __init__(self, columns, cpt_ids, offsets, elevationColumn = 'Elevation'):
+        if elevationColumn not in columns:
+            raise ValueError('The index needs the ' + elevationColumn + ' column')
+        self.cpt_ids = list(cpt_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.elevationColumn = elevationColumn
+        self._position = {cpt_id: ii for ii, cpt_id in enumerate(self.cpt_ids)}
+        if len(self._position) != len(self.cpt_ids):
+            raise ValueError('CPT IDs must be unique')
+
+        #Sort every sounding by elevation: one lexsort over (sounding, elevation)
+        lengths = np.diff(self.offsets)
+        sounding = np.repeat(np.arange(len(lengths)), lengths)
+        elevation = np.asarray(columns[elevationColumn], dtype=float)
+        if len(elevation) != self.offsets[-1]:
+            raise ValueError('Offsets do not match the number of rows')
+        self.order = np.lexsort((elevation, sounding))             # Source row of each index row
+
+        self._arrays = {}
+        for name, values in columns.items():
+            array = np.ascontiguousarray(np.asarray(values)[self.order])
+            array.flags.writeable = False
+            self._arrays[name] = array
+
+    @classmethod
+    def fromFrame(cls, df, columns = None, elevationColumn = 'Elevation'):
+        """Index over a compiled frame with a (CPT, index) MultiIndex (see processingCPT.datasetOffsets)"""
+        columns = list(df.columns) if columns is None else list(columns)
+        if elevationColumn not in columns:
+            columns.append(elevationColumn)
+        cpt_ids, offsets = datasetOffsets(df)
+        return cls({name: df[name].to_numpy() for name in columns}, cpt_ids, offsets, elevationColumn)
+
+    @classmethod
+    def fromCompiled(cls, dataset, columns = None, elevationColumn = 'Elevation'):
+        """Index over a compiledDataset.CompiledTable or CompiledDataset (text columns as object arrays)"""
+        columns = list(dataset.columns) if columns is None else list(columns)
+        if elevationColumn not in columns:
+            columns.append(elevationColumn)
+        arrays = {}
+        for name in columns:
+            values = dataset.column(name)
+            arrays[name] = np.asarray(values, dtype=object) if isinstance(values, pd.Categorical) else values
+        return cls(arrays, dataset.cpt_ids, dataset.offsets, elevationColumn)
+
+    @property
+    def columns(self):
+        return list(self._arrays)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __contains__(self, cpt_id):
+        return cpt_id in self._position
+
+    def rows(self, cpt_id):
+        """Slice of the index arrays holding one CPT"""
+        try:
+            ii = self._position[cpt_id]
+        except KeyError:
+            raise KeyError('CPT not in the index: ' + str(cpt_id)) from None
+        return slice(int(self.offsets[ii]), int(self.offsets[ii+1]))
+
+    def array(self, column):
+        """Whole column in index order (every sounding sorted by elevation)"""
+        return self._arrays[column]
+
+    def _views(self, rows, column):
+        if column is None:
+            return {name: array[rows] for name, array in self._arrays.items()}
+        if isinstance(column, str):
+            return self._arrays[column][rows]
+        return {name: self._arrays[name][rows] for name in column}
+
+    def get(self, cpt_id, column = None):
+        """
+        Values of one CPT sorted by elevation: a view for one column name, a dict of views
+        for a list of columns (all columns when None)
+        """
+        return self._views(self.rows(cpt_id), column)
+
+    def __getitem__(self, key):
+        """index[cpt_id] or index[cpt_id, column], like df.loc"""
+        if isinstance(key, tuple):
+            return self.get(*key)
+        return self.get(key)
+
+    def elevationRows(self, cpt_id, elev1, elev2):
+        """Slice of the rows of a CPT with elev1 <= Elevation <= elev2 (as Series.between)"""
+        rows = self.rows(cpt_id)
+        elevation = self._arrays[self.elevationColumn][rows]
+        lo = np.searchsorted(elevation, elev1, side='left')
+        hi = np.searchsorted(elevation, elev2, side='right')
+        return slice(rows.start + int(lo), rows.start + int(max(hi, lo)))
+
+    def between(self, cpt_id, elev1, elev2, column = None):
+        """Views of the rows of a CPT with elev1 <= Elevation <= elev2"""
+        return self._views(self.elevationRows(cpt_id, elev1, elev2), column)
+
+    def sourceRows(self, cpt_id):
+        """Row positions in the source frame of a CPT's index rows (to write results back)"""
+        return self.order[self.rows(cpt_id)]
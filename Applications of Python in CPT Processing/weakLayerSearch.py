@@ -0,0 +1,134 @@
+
+## WEAK LAYER SEARCH OVER A COMPILED CPT DATASET
+#
+# Answers "is there at least fraction * thickness of <layer> with <parameter> <= threshold
+# between elevations elev1 and elev2?" for every CPT, thickness, threshold and window,
+# the sweep of Weak_Layer Iteration.ipynb. Each sounding is sorted by elevation once and
+# holds prefix counts of the layer samples below each threshold, so every window is two
+# searchsorted positions and a subtraction instead of three boolean masks over the frame.
+#
+#   df = pd.concat([pd.read_csv(p + '/COMPILED_CPTs.csv', index_col=[0,1]) for p in ('P17', 'P18')])
+#   result = weakLayerSearch(df)                      # tidy table, one row per combination
+#   result[result['Weak Layer']]
+
+import numpy as np
+import pandas as pd
+
+from processingCPT import datasetOffsets
+
+THICKNESSES = [0.5, 1, 1.5, 2, 2.5, 3]
+THRESHOLDS = list(range(5, 20+1))
+WINDOW_BOTTOMS = np.arange(0, 25, 0.25)
+
+RESULT_COLUMNS = ['CPT', 'Thickness', 'Threshold', 'Elev. Bottom', 'Elev. Top',
+                  'Samples', 'Spacing', 'Weak Layer']
+
+
+def sampleSpacing(elevation):
+    """Median spacing between consecutive samples of one sounding (NaN with less than two samples)"""
+    elev = np.sort(np.asarray(elevation, dtype=float))
+    step = np.diff(elev[~np.isnan(elev)])
+    step = step[step > 0]
+    return float(np.median(step)) if len(step) else np.nan
+
+
+def soundingCounts(elevation, values, candidate, thresholds, bottoms, tops):
+    """
+    Samples of one sounding inside each window with value <= threshold
+
+    Parameters
+        ----------
+        elevation, values : numeric arrays of the sounding
+        candidate : boolean array
+            Rows taking part (ex. Layer IDX == 'CCR')
+        thresholds : array (T,)
+        bottoms, tops : arrays (W,)
+            Window limits, both included (as Series.between)
+
+    Returns
+        -------
+        int array (T, W)
+    """
+    order = np.argsort(elevation, kind='stable')            # NaN elevations sorted last, never inside a window
+    elev = elevation[order]
+    with np.errstate(invalid='ignore'):
+        below = candidate[order] & (values[order] <= thresholds[:, None])   # (T, rows), NaN values never count
+
+    prefix = np.zeros((len(thresholds), len(elev) + 1), dtype=np.int64)
+    np.cumsum(below, axis=1, out=prefix[:, 1:])
+
+    lo = np.searchsorted(elev, bottoms, side='left')
+    hi = np.searchsorted(elev, tops, side='right')
+    return prefix[:, hi] - prefix[:, lo]
+
+
+def weakLayerSearch(df, parameter = 'Tip Res.', layer = 'CCR', thicknesses = THICKNESSES, thresholds = THRESHOLDS,
+                    bottoms = WINDOW_BOTTOMS, spacing = None, fraction = 0.9,
+                    elevationColumn = 'Elevation', layerColumn = 'Layer IDX'):
+    """
+    Weak layer sweep over every CPT of a compiled dataset
+
+    Parameters
+        ----------
+        df : pd.DataFrame with a (CPT, index) MultiIndex (COMPILED_CPTs.csv), several projects can be concatenated
+        parameter : str
+            Column compared with the thresholds (value <= threshold is weak)
+        layer : str
+            Layer IDX of the samples taking part, None uses every sample
+        thicknesses : list of float
+            Target thicknesses, window top = bottom + thickness
+        thresholds : list of float
+        bottoms : array
+            Window bottom elevations
+        spacing : float
+            Thickness represented by one sample. None uses the median sample spacing of each
+            sounding; 0.065 reproduces the notebook.
+        fraction : float
+            A window is a weak layer when Samples * Spacing > fraction * Thickness
+
+    Returns
+        -------
+        pd.DataFrame with RESULT_COLUMNS, one row per (CPT, thickness, threshold, window)
+        in the order of the notebook loops
+    """
+    cpt_ids, offsets = datasetOffsets(df)
+    elevation = df[elevationColumn].to_numpy(dtype=float)
+    values = df[parameter].to_numpy(dtype=float)
+    if layer is None:
+        candidate = np.ones(len(df), dtype=bool)
+    else:
+        candidate = (df[layerColumn] == layer).to_numpy(dtype=bool, na_value=False)
+
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    bottoms = np.asarray(bottoms, dtype=float)
+    n_k, n_t, n_b = len(thicknesses), len(thresholds), len(bottoms)
+
+    #Every window of every thickness, thickness-major
+    win_bottom = np.tile(bottoms, n_k)
+    win_top = (bottoms[None, :] + thicknesses[:, None]).ravel()
+
+    samples = np.empty((len(cpt_ids), n_k, n_t, n_b), dtype=np.int64)
+    spacings = np.empty(len(cpt_ids))
+    for ii in range(len(cpt_ids)):
+        rows = slice(offsets[ii], offsets[ii+1])
+        counts = soundingCounts(elevation[rows], values[rows], candidate[rows], thresholds, win_bottom, win_top)
+        samples[ii] = counts.reshape(n_t, n_k, n_b).transpose(1, 0, 2)
+        spacings[ii] = sampleSpacing(elevation[rows]) if spacing is None else spacing
+
+    shape = samples.shape
+    thickness = np.broadcast_to(thicknesses[None, :, None, None], shape)
+    sample_spacing = np.broadcast_to(spacings[:, None, None, None], shape)
+    with np.errstate(invalid='ignore'):
+        weak = samples * sample_spacing > fraction * thickness
+
+    return pd.DataFrame({'CPT'          : np.repeat(np.asarray(cpt_ids, dtype=object), n_k * n_t * n_b),
+                         'Thickness'    : thickness.ravel(),
+                         'Threshold'    : np.broadcast_to(thresholds[None, None, :, None], shape).ravel(),
+                         'Elev. Bottom' : np.broadcast_to(bottoms, shape).ravel(),
+                         'Elev. Top'    : np.broadcast_to((bottoms[None, :] + thicknesses[:, None])[None, :, None, :],
+                                                          shape).ravel(),
+                         'Samples'      : samples.ravel(),
+                         'Spacing'      : sample_spacing.ravel(),
+                         'Weak Layer'   : weak.ravel()},
+                        columns = RESULT_COLUMNS)
@@ -53,17 +53,15 @@ def filterCPT(raw, wSize = 11 , option = 'median', alpha = 0.8):
             Filtering option (default is 'median')
         alpha : float
             Alpha value to calculate qt using qc and u2
+        qc and fs are filtered together with one rolling window over both columns
+        (running median / running sum, no per-column apply).
     """
-    filtered_data = raw.copy()
-
-    if option == 'median':
-        f = lambda x : x.rolling(wSize,center=True,min_periods=1).median()
-    elif option == 'average':
-        f = lambda x : x.rolling(wSize,center=True,min_periods=1).mean()
-    else:
+    if option not in ('median', 'average'):
         raise ValueError('Provide filtering method')
 
-    filtered_data[['qc','fs']] =  filtered_data[['qc','fs']].apply(axis=0, func = f )
+    filtered_data = raw.copy()
+    window = filtered_data[['qc','fs']].astype(float).rolling(wSize, center=True, min_periods=1)
+    filtered_data[['qc','fs']] = window.median() if option == 'median' else window.mean()
     filtered_data['qt'] = filtered_data['qc'] + filtered_data['u2'] * (1- alpha)
 
     return filtered_data
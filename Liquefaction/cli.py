@@ -0,0 +1,282 @@
+
+## HEADLESS COMMAND LINE ENTRY POINT
+#
+# Batch run of the liquefaction pipeline without plotting (plotly is never imported)
+# and without hardcoded paths:
+#
+#   python cli.py <input_dir> <output_dir> [--config run.json] [--workers 4] [--format npz] ...
+#   python cli.py <input_dir> <output_dir> --watch --interval 60
+#
+# In watch mode the input folder is polled and only new or modified soundings are
+# processed. The file size and modification time of every processed sounding are kept
+# in <output_dir>/.processed.json, so a restarted watcher does not redo the folder,
+# together with a hash of the profiles and constants: editing the soil / GWT files or
+# the config makes the next poll redo every sounding.
+#
+# Config file (JSON, every key optional, command line flags take precedence):
+#   {"a_n": 0.8, "gamma_w": 9.81, "pa_atm": 101.325,
+#    "soil_profile": "soil.csv",  or  "soil_profiles": "soils_per_sounding.csv",
+#    "gwt": "gwt.csv", "pattern": "*.txt", "workers": null, "chunksize": 4,
+#    "output_format": "csv", "cache_dir": null, "precision": "float64",
+#    "instrument": false, "run_report": null, "kernels": false}
+
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+import argparse
+import traceback
+
+import loading_CPT_and_profiles_rev2 as loadCPT
+import parallelRunner as runner
+import instrumentation
+
+DEFAULT_CONFIG = {'a_n': 0.8,
+                  'gamma_w': 9.81,        #kN/m3
+                  'pa_atm': 101.325,      #kPa
+                  'soil_profile': None,
+                  'soil_profiles': None,
+                  'gwt': None,
+                  'pattern': '*.txt',
+                  'workers': None,
+                  'chunksize': 4,
+                  'output_format': 'csv',
+                  'cache_dir': None,
+                  'precision': 'float64',
+                  'instrument': False,
+                  'run_report': None,
+                  'kernels': False}
+
+STATE_FILE = '.processed.json'
+INPUTS_KEY = '.inputs'          # State entry with the inputsSignature the soundings were processed with
+
+#Config keys that change the results
+RESULT_KEYS = ('a_n', 'gamma_w', 'pa_atm', 'precision', 'output_format')
+
+
+def loadConfig(path=None, overrides=None):
+    """
+    Arguments:
+    path      : str
+                JSON config file, None uses the defaults
+    overrides : dict
+                Values taking precedence over the file (None values are ignored)
+
+    Returns:
+        dict with every DEFAULT_CONFIG key
+    """
+    config = dict(DEFAULT_CONFIG)
+    if path is not None:
+        with open(path) as f:
+            user = json.load(f)
+        unknown = set(user) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError('Unknown config keys: ' + str(sorted(unknown)))
+        config.update(user)
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
+    if config['soil_profile'] is not None and config['soil_profiles'] is not None:
+        raise ValueError('Use either soil_profile or soil_profiles, not both')
+    return config
+
+
+def loadProfiles(config):
+    """Soil profile (or dict of profiles per sounding) and GWT table named in the config"""
+    if config['soil_profiles'] is not None:
+        soilProfile = loadCPT.readSoilProfiles(config['soil_profiles'])
+    else:
+        soilProfile = loadCPT.readSoilProfile(config['soil_profile'])
+    return soilProfile, loadCPT.readGWT(config['gwt'])
+
+
+def findSoundings(input_dir, pattern='*.txt'):
+    return sorted(glob.glob(os.path.join(input_dir, pattern)))
+
+
+def inputsSignature(config, soilProfile, gwt_levels):
+    """Hash of the soil / GWT profiles and of the config values that change the results"""
+    h = hashlib.sha256()
+    profiles = soilProfile if isinstance(soilProfile, dict) else {'': soilProfile}
+    for name in sorted(profiles):
+        h.update(('\nsoil ' + str(name) + '\n').encode() + profiles[name].to_csv().encode())
+    h.update(b'\ngwt\n' + gwt_levels.to_csv().encode())
+    h.update(json.dumps({key: config[key] for key in RESULT_KEYS}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def loadState(output_dir):
+    """file name -> [size, mtime_ns] of the soundings already processed (plus INPUTS_KEY)"""
+    try:
+        with open(os.path.join(output_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveState(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def fileSignature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def pendingSoundings(files, state, settle=0.0):
+    """
+    New or modified files. Files written less than settle seconds ago are skipped
+    (still uploading) and picked up on a later poll.
+    """
+    now = time.time()
+    pending = []
+    for path in files:
+        try:
+            signature = fileSignature(path)
+        except OSError:              # Removed since the folder listing
+            continue
+        if state.get(os.path.basename(path)) == signature:
+            continue
+        if now - signature[1] / 1e9 < settle:
+            continue
+        pending.append(path)
+    return pending
+
+
+def runFiles(files, output_dir, config, soilProfile, gwt_levels):
+    """
+    Runs the pipeline on files and prints a short summary
+
+    Returns:
+        runParallel report
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report = runner.runParallel(files, output_dir, config['a_n'], config['gamma_w'], config['pa_atm'],
+                                workers = config['workers'], chunksize = config['chunksize'],
+                                soilProfile = soilProfile, gwt_levels = gwt_levels,
+                                output_format = config['output_format'], cache_dir = config['cache_dir'],
+                                precision = config['precision'], instrument = config['instrument'],
+                                kernels = config['kernels'])
+
+    failed = [entry for entry in report if entry['error'] is not None]
+    print(time.strftime('%Y-%m-%d %H:%M:%S'), len(report) - len(failed), 'files processed,',
+          len(failed), 'failed', flush=True)
+    for entry in failed:
+        print('  ' + entry['file'] + ':', entry['error'].strip().splitlines()[-1], flush=True)
+
+    if config['instrument'] and config['run_report']:
+        instrumentation.writeRunReport(report, config['run_report'])
+        print(instrumentation.slowestFiles(report), flush=True)
+    return report
+
+
+def processFolder(input_dir, output_dir, config, only_new=False, settle=0.0,
+                  soilProfile=None, gwt_levels=None):
+    """
+    One pass over the input folder. The state file is updated for the files that succeeded,
+    failed files are retried on the next pass. When the profiles or the constants differ
+    from the ones in the state file, every sounding counts as new.
+
+    Returns:
+        runParallel report (empty when there is nothing to process)
+    """
+    if soilProfile is None or gwt_levels is None:
+        soilProfile, gwt_levels = loadProfiles(config)
+    state = loadState(output_dir)
+    inputs = inputsSignature(config, soilProfile, gwt_levels)
+    if state.get(INPUTS_KEY) != inputs:
+        state = {INPUTS_KEY: inputs}
+    files = findSoundings(input_dir, config['pattern'])
+    if only_new:
+        files = pendingSoundings(files, state, settle)
+
+    signatures = {}                              # Taken before reading the files
+    for path in files:
+        try:
+            signatures[path] = fileSignature(path)
+        except OSError:                          # Removed since the folder listing
+            continue
+    files = [path for path in files if path in signatures]
+    if not files:
+        return []
+
+    report = runFiles(files, output_dir, config, soilProfile, gwt_levels)
+    for entry in report:
+        if entry['error'] is None:
+            state[os.path.basename(entry['file'])] = signatures[entry['file']]
+    saveState(output_dir, state)
+    return report
+
+
+def watch(input_dir, output_dir, config, interval=60.0, settle=10.0, max_polls=None):
+    """
+    Polls input_dir every interval seconds and processes new or modified soundings.
+    Profiles are reloaded on every poll, an edit to the soil / GWT files or to the
+    constants reprocesses every sounding (see processFolder).
+    A poll that fails (unreadable profiles, output folder or state file errors) is
+    logged and retried on the next poll. Stops on Ctrl+C or after max_polls polls.
+    """
+    print('Watching', input_dir, 'every', interval, 's (Ctrl+C to stop)', flush=True)
+    polls = 0
+    try:
+        while max_polls is None or polls < max_polls:
+            try:
+                processFolder(input_dir, output_dir, config, only_new=True, settle=settle)
+            except Exception:
+                print(time.strftime('%Y-%m-%d %H:%M:%S'), 'Poll failed:',
+                      traceback.format_exc().strip().splitlines()[-1], flush=True)
+            polls += 1
+            if max_polls is None or polls < max_polls:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        print('Stopped', flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless CPT liquefaction batch run')
+    parser.add_argument('input_dir', help='Folder with the raw CPT files')
+    parser.add_argument('output_dir', help='Folder for the results')
+    parser.add_argument('--config', help='JSON config file (see the module header)')
+    parser.add_argument('--pattern', help='CPT file pattern inside input_dir (default *.txt)')
+    parser.add_argument('--soil-profile', dest='soil_profile', help='Soil profile .csv for every sounding')
+    parser.add_argument('--soil-profiles', dest='soil_profiles', help='Soil profiles .csv with a Sounding column')
+    parser.add_argument('--gwt', help='GWT table .csv')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: all cores)')
+    parser.add_argument('--format', dest='output_format', choices=['csv', 'npz'])
+    parser.add_argument('--cache-dir', dest='cache_dir', help='Result cache folder')
+    parser.add_argument('--precision', choices=['float64', 'float32'])
+    parser.add_argument('--report', dest='run_report', help='Write a per-stage run report (.csv or .json)')
+    parser.add_argument('--kernels', action='store_true', default=None,
+                        help='Compute the derived columns with the fused in-place kernels (geoKernels)')
+    parser.add_argument('--only-new', action='store_true',
+                        help='Skip soundings unchanged since the last run in output_dir')
+    parser.add_argument('--watch', action='store_true', help='Keep polling input_dir for new soundings')
+    parser.add_argument('--interval', type=float, default=60.0, help='Seconds between polls (watch mode)')
+    parser.add_argument('--settle', type=float, default=10.0,
+                        help='Ignore files modified less than this many seconds ago (watch mode)')
+    args = parser.parse_args(argv)
+
+    overrides = {key: getattr(args, key) for key in ('pattern', 'soil_profile', 'soil_profiles', 'gwt', 'workers',
+                                                     'output_format', 'cache_dir', 'precision', 'run_report',
+                                                     'kernels')}
+    if args.run_report:
+        overrides['instrument'] = True
+    config = loadConfig(args.config, overrides)
+
+    if args.watch:
+        watch(args.input_dir, args.output_dir, config, args.interval, args.settle)
+        return 0
+
+    report = processFolder(args.input_dir, args.output_dir, config, only_new=args.only_new)
+    if not report:
+        print('No CPT files to process in', args.input_dir)
+    return 1 if any(entry['error'] is not None for entry in report) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,287 @@
+
+## MULTI-SOUNDING BATCH MODULE
+#
+# All soundings of a project are concatenated into one set of contiguous arrays
+# plus an offsets array (CSR style): sounding k lives in rows offsets[k]:offsets[k+1].
+# Every kernel then runs once over the whole batch instead of once per file.
+
+import os
+import numpy as np
+import pandas as pd
+
+import loading_CPT_and_profiles_rev2 as loadCPT
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+import derivedGraph
+import geoKernels
+import instrumentation
+import precision as prec
+
+
+def soundingName(path):
+    """Sounding name used for the output files, ex. 'saudardalsstifla-2-CPT.txt' -> '2' """
+    parts = os.path.basename(path).split('-')
+    if len(parts) < 2:
+        raise ValueError('No sounding name in ' + str(path) + ", expected '<site>-<sounding>-...'")
+    return parts[1]
+
+
+def soundingPaths(paths):
+    """Sounding name -> path, raises ValueError when two different files give the same sounding name"""
+    names = {}
+    for path in paths:
+        name = soundingName(path)
+        if name in names and os.path.abspath(names[name]) != os.path.abspath(path):
+            raise ValueError('Sounding ' + name + ' found in both ' + str(names[name]) + ' and ' + str(path))
+        names[name] = path
+    return names
+
+
+def readSoundings(paths):
+    """
+    Arguments:
+    paths : list of str
+            CPT files to be loaded with readCPTfile
+
+    Returns:
+        dict with sounding name as key and the readCPTarray output as value.
+        Raises ValueError when two files give the same sounding name.
+    """
+    return {name: loadCPT.readCPTarray(path) for name, path in soundingPaths(paths).items()}
+
+
+def concatSoundings(soundings):
+    """
+    Arguments:
+    soundings : dict
+                Sounding name -> readCPTarray output or DataFrame with the
+                readCPTfile columns ['Depth (m)','qc (MPa)','fs (MPa)','u2 (MPa)']
+
+    Returns:
+        columns : dict with one contiguous float64 array per column
+        offsets : np.array (int64) of length N+1
+        names   : list with the N sounding names
+    """
+    names = list(soundings)
+    lengths = np.array([len(soundings[name]) for name in names], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+    data = np.empty((offsets[-1], len(loadCPT.CPT_COLUMNS)), dtype=np.float64)
+    for name, start, stop in zip(names, offsets[:-1], offsets[1:]):
+        sounding = soundings[name]
+        if isinstance(sounding, pd.DataFrame):
+            sounding = sounding[loadCPT.CPT_COLUMNS].to_numpy(dtype=np.float64)
+        data[start:stop] = sounding
+
+    columns = {col: np.ascontiguousarray(data[:,ii]) for ii, col in enumerate(loadCPT.CPT_COLUMNS)}
+    return columns, offsets, names
+
+
+def segmentStarts(offsets):
+    """Index of the first row of every non-empty sounding"""
+    offsets = np.asarray(offsets)
+    starts = offsets[:-1]
+    return starts[np.diff(offsets) > 0]
+
+
+def segmentedCumsum(arr, offsets, dtype=np.float64):
+    """
+    Cumulative sum that restarts at every sounding boundary.
+    The running sum is accumulated in dtype (float64 by default) so float32
+    inputs do not lose precision on long batches.
+    """
+    offsets = np.asarray(offsets)
+    cs = np.cumsum(arr, dtype=dtype)
+    lengths = np.diff(offsets)
+    starts = offsets[:-1]
+    base = np.zeros(len(lengths), dtype=dtype)
+    nonempty = lengths > 0
+    base[nonempty] = cs[starts[nonempty]] - np.asarray(arr, dtype=dtype)[starts[nonempty]]
+    return cs - np.repeat(base, lengths)
+
+
+def segmentedSoilStresses(depth, unit_weight, PP_profile, gamma_w, offsets):
+    """
+    Same as cptGeotech.soilStresses but for a batch of soundings. Delta_z and
+    the total stress integration restart at every sounding boundary.
+
+    Arguments:
+    depth       : np.array
+                  Concatenated CPT depth arrays
+    unit_weight : np.array
+    PP_profile  : np.array
+                  Depth to the water table for every row
+    gamma_w     : float
+    offsets     : np.array
+                  Sounding boundaries as returned by concatSoundings
+
+    Returns:
+        2D np.array with 3 columns: Total, Pore Pressure, Effective Stresses
+    """
+    ### Total Stress Calculations
+    delta_z = np.empty_like(depth)
+    delta_z[1:] = depth[1:] - depth[:-1]
+    starts = segmentStarts(offsets)
+    delta_z[starts] = depth[starts]                 # First row of each sounding starts from the surface
+    layer_weight = delta_z * unit_weight
+    sigma_t = segmentedCumsum(layer_weight, offsets).astype(layer_weight.dtype, copy=False)
+
+    ### Pore Pressure Calculation
+    pore_pressure = (depth - PP_profile) * gamma_w
+    pore_pressure = np.where( pore_pressure < 0 , 0 , pore_pressure)
+
+    ### Effective Stress Calculations
+    sigma_e = sigma_t - pore_pressure
+
+    return np.stack((sigma_t , pore_pressure , sigma_e),axis=-1)
+
+
+def computeBatch(columns, offsets, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, names=None,
+                 precision='float64', outputs=None, timer=None, workspace=None):
+    """
+    Runs the main_rev2 liquefaction pipeline once over a whole batch.
+
+    Arguments:
+    columns, offsets : output of concatSoundings
+    soilProfile      : pd.DataFrame from readSoilProfile, used for every sounding,
+                       or dict  sounding name -> profile  from readSoilProfiles
+    gwt_levels       : pd.DataFrame from readGWT
+    a_n, gamma_w, pa_atm : float
+    names            : list of str
+                       Sounding names (concatSoundings output), needed for a dict of profiles
+    precision        : 'float64' or 'float32'
+                       Floating point type used end-to-end (see precision module)
+    outputs          : list of str
+                       Derived columns to compute (see derivedGraph.DERIVED_COLUMNS),
+                       None computes all of them. The input and stress columns are always returned.
+    timer            : instrumentation.StageTimer
+                       Records the mapping, stresses, n iteration, geo and per-method stages
+    workspace        : geoKernels.GeoWorkspace
+                       Computes the derived columns with the fused geoKernels, reusing the
+                       workspace buffers across calls (its dtype should match precision).
+                       Every derived column is then computed, outputs only selects the ones
+                       returned. None evaluates the derived-column graph.
+
+    Returns:
+        dict with one array per main_rev2 output column (same names and order)
+    """
+    if timer is None:
+        timer = instrumentation.NULL_TIMER
+    depth = prec.asPrecision(columns['Depth (m)'], precision)
+    n_rows = depth.size
+    out = {'Depth (m)': depth}
+
+    #All columns in kPa
+    out['qc (kPa)'] = prec.asPrecision(columns['qc (MPa)'], precision) * 1000
+    out['fs (kPa)'] = prec.asPrecision(columns['fs (MPa)'], precision) * 1000
+    out['u2 (kPa)'] = prec.asPrecision(columns['u2 (MPa)'], precision) * 1000
+
+    #Mappping Soil Profile Properties
+    if isinstance(soilProfile, dict):
+        soilProfile = [soilProfile[name] for name in names]
+    with timer.stage('mapping', n_rows):
+        mapped, layer_table = cptGeotech.cptMapperTyped(depth, soilProfile, gwt_levels, offsets)
+        layer_names = layer_table['Layer Name'].to_numpy(dtype=str)
+        gwt_names = gwt_levels.index.to_numpy(dtype=str)
+        out['Layer IDX'] = np.where(mapped['layer'] >= 0, layer_names[np.maximum(mapped['layer'], 0)], '')
+        out['Total Unit Weight'] = prec.asPrecision(mapped['unit_weight'], precision)
+        out['GWT_ID'] = np.where(mapped['gwt'] >= 0, gwt_names[np.maximum(mapped['gwt'], 0)], '')
+        out['GWT Depth'] = prec.asPrecision(mapped['gwt_depth'], precision)
+
+    #Soil Stresses Calculations
+    with timer.stage('stresses', n_rows):
+        stresses = segmentedSoilStresses(depth, out['Total Unit Weight'], out['GWT Depth'], gamma_w, offsets)
+    out['Total Stress (kPa)'] = stresses[:,0]
+    out['Pore Pressure (kPa)'] = stresses[:,1]
+    out['Effective Stress (kPa)'] = stresses[:,2]
+
+    qt = out['qc (kPa)'] + (1 - a_n) * out['u2 (kPa)']
+    out['qt (kPa)'] = qt
+
+    # Variables for geotech calculations
+    fs = np.where( out['fs (kPa)'] <= 0 , 0.001 , out['fs (kPa)'])
+    sigma_T = out['Total Stress (kPa)']
+    sigma_E = out['Effective Stress (kPa)']
+
+    if workspace is not None:
+        #Fused kernels, the output blocks are new arrays and only the scratch buffers are reused
+        names_out = derivedGraph.DERIVED_COLUMNS if outputs is None else outputs
+        unknown = [name for name in names_out if name not in derivedGraph.DERIVED_COLUMNS]
+        if unknown:
+            raise KeyError('Unknown derived column: ' + str(unknown[0]))
+        with timer.stage('geo', n_rows):
+            geo = geoKernels.geoComputationsInto(qt, fs, sigma_T, sigma_E, pa_atm, workspace,
+                                                 out=np.empty((n_rows, len(geoKernels.GEO_COLUMNS)),
+                                                              dtype=qt.dtype, order='F'))
+        with timer.stage('residual strength', n_rows):
+            rs = geoKernels.residualStrengthsInto(qt, sigma_E, geo[:,4], geo[:,5], geo[:,6], pa_atm, workspace,
+                                                  out=np.empty((n_rows, len(geoKernels.RS_COLUMNS)),
+                                                               dtype=qt.dtype, order='F'))
+        derived = dict(zip(geoKernels.GEO_COLUMNS, geo.T))
+        derived.update(zip(geoKernels.RS_COLUMNS, rs.T))
+        out.update((name, derived[name]) for name in names_out)
+        return out
+
+    #Derived columns, only the subgraph needed for the requested outputs is computed
+    graph = derivedGraph.DerivedGraph(qt, fs, sigma_T, sigma_E, pa_atm)
+    if timer.enabled:
+        #Evaluate the graph stage by stage so each one is timed on its own (results are memoized)
+        needed = derivedGraph.requiredNodes(derivedGraph.DERIVED_COLUMNS if outputs is None else outputs)
+        stages = [('n iteration', ['n_iter']), ('geo', ['Fr','Qt_1','Ic_o','Qt_n','Ic_n','Friction Angle'])]
+        stages += [(method, ['_' + method]) for method in RS.RS_METHODS]
+        for stage, nodes in stages:
+            nodes = [name for name in nodes if name in needed]
+            if nodes:
+                with timer.stage(stage, n_rows):
+                    for name in nodes:
+                        graph.get(name)
+    out.update(graph.compute(outputs))
+
+    return out
+
+
+def batchToFrame(results, offsets, names):
+    """
+    Builds a DataFrame with a (CPT, index) MultiIndex, same layout as the compiled CPT files
+    """
+    lengths = np.diff(offsets)
+    cpt_level = np.repeat(np.arange(len(names)), lengths)
+    row_level = np.arange(offsets[-1]) - np.repeat(offsets[:-1], lengths)
+    index = pd.MultiIndex.from_arrays([np.asarray(names, dtype=object)[cpt_level], row_level],
+                                      names = ['CPT', None])
+    return pd.DataFrame(results, index = index)
+
+
+def runBatch(soundings, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, precision='float64', outputs=None,
+             workspace=None):
+    """
+    Arguments:
+    soundings : dict
+                Sounding name -> readCPTarray output (see readSoundings)
+    soilProfile : pd.DataFrame or dict of pd.DataFrame (see computeBatch)
+    precision : 'float64' or 'float32'
+    outputs   : list of str
+                Derived columns to compute, None computes all of them
+    workspace : geoKernels.GeoWorkspace
+                Use the fused kernels (see computeBatch)
+
+    Returns:
+        pd.DataFrame with all soundings and a (CPT, index) MultiIndex
+    """
+    columns, offsets, names = concatSoundings(soundings)
+    results = computeBatch(columns, offsets, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, names, precision,
+                           outputs, workspace=workspace)
+    return batchToFrame(results, offsets, names)
+
+
+def precisionReport(soundings, soilProfile, gwt_levels, a_n, gamma_w, pa_atm):
+    """
+    Runs a batch in float32 and float64 and compares every output column
+
+    Returns:
+        pd.DataFrame from precision.accuracyReport (float32 against float64)
+    """
+    columns, offsets, names = concatSoundings(soundings)
+    run = lambda precision: computeBatch(columns, offsets, soilProfile, gwt_levels,
+                                         a_n, gamma_w, pa_atm, names, precision)
+    return prec.accuracyReport(run('float32'), run('float64'))
@@ -6,6 +6,8 @@
 import pandas as pd
 import numpy as np
 
+import precision as prec
+
 def cptMapper(depth_array,soilProfile):
     """
     Arguments:
@@ -18,7 +20,7 @@ def cptMapper(depth_array,soilProfile):
         2D np.array with 1 column per mapped property
     """   
     #Create soil profile intervals for later mapping properties    
-    soilProfile_mapper = np.array([soilProfile['Top Depth'],soilProfile['Top Depth'][1:].append(pd.Series([100000]),ignore_index=True)])
+    soilProfile_mapper = np.array([soilProfile['Top Depth'],pd.concat([soilProfile['Top Depth'][1:],pd.Series([100000])],ignore_index=True)])
     soilProfile_mapper= np.transpose(soilProfile_mapper)
     profile_interval = pd.IntervalIndex.from_arrays(soilProfile_mapper[:,0],
                                                         soilProfile_mapper[:,1],closed= 'left')  
@@ -32,6 +34,72 @@ def cptMapper(depth_array,soilProfile):
     
     return np.stack((layerIDX,total_unit_weight,gwt_id),axis=-1) #Stack arrays as individual columns
 
+#Record layout returned by cptMapperTyped
+MAPPED_DTYPE = np.dtype([('layer', np.int32),          # Row of the soil profile (-1 if outside the profile)
+                         ('unit_weight', np.float64),
+                         ('gwt', np.int32),            # Row of the GWT table
+                         ('gwt_depth', np.float64)])
+
+def cptMapperTyped(depth_array, soilProfile, gwt_levels, offsets=None):
+    """
+    Typed version of cptMapper. Layers are found with np.searchsorted on the sorted
+    top depths (same [top, next top) intervals as cptMapper), so no IntervalIndex
+    or object arrays are created.
+    
+    Arguments:
+    depth_array : np.array
+                  CPT depth Array. For a batch, the concatenated depths of all soundings.
+    soilProfile : pd.DataFrame or list of pd.DataFrame
+                  Soil profile, or one profile per sounding when offsets is given.
+    gwt_levels  : pd.DataFrame
+                  GWT table from readGWT, indexed by GWT_ID
+    offsets     : np.array
+                  Sounding boundaries (see cptBatch.concatSoundings). Required for a
+                  list of profiles.
+    
+    Returns:
+        mapped      : structured np.array with MAPPED_DTYPE
+        layer_table : pd.DataFrame with the profile rows referred to by mapped['layer']
+                      (profiles are concatenated when there is one per sounding)
+    """
+    depth_array = np.asarray(depth_array, dtype=np.float64)
+    if isinstance(soilProfile, pd.DataFrame):
+        profiles = [soilProfile]
+        offsets = np.array([0, depth_array.size])
+    else:
+        profiles = list(soilProfile)
+        if offsets is None or len(offsets) != len(profiles) + 1:
+            raise ValueError('One soil profile per sounding is required')
+    
+    layer_table = pd.concat([profile.sort_values('Top Depth') for profile in profiles], ignore_index=True)
+    gwt_index = pd.Index(gwt_levels.index)
+    gwt_codes = gwt_index.get_indexer(layer_table['GWT'])
+    if (gwt_codes < 0).any():
+        raise KeyError('GWT IDs not in the GWT table: ' + str(list(layer_table.loc[gwt_codes < 0,'GWT'].unique())))
+    
+    layer_code = np.full(depth_array.size, -1, dtype=np.int32)
+    first_row = 0
+    for profile, start, stop in zip(profiles, offsets[:-1], offsets[1:]):
+        tops = np.sort(profile['Top Depth'].to_numpy(dtype=np.float64))
+        depth = depth_array[start:stop]
+        code = np.searchsorted(tops, depth, side='right') - 1
+        code[depth >= 100000] = -1             # Same upper bound as cptMapper
+        layer_code[start:stop] = np.where(code >= 0, code + first_row, -1)
+        first_row += len(tops)
+    
+    valid = layer_code >= 0
+    code = np.where(valid, layer_code, 0)
+    unit_weights = layer_table['Total Unit Weight'].to_numpy(dtype=np.float64)
+    gwt_depths = gwt_levels['Depth To'].to_numpy(dtype=np.float64)
+    
+    mapped = np.empty(depth_array.size, dtype=MAPPED_DTYPE)
+    mapped['layer'] = layer_code
+    mapped['unit_weight'] = np.where(valid, unit_weights[code], np.nan)
+    mapped['gwt'] = np.where(valid, gwt_codes[code], -1)
+    mapped['gwt_depth'] = np.where(valid, gwt_depths[gwt_codes[code]], np.nan)
+    
+    return mapped, layer_table
+
 def soilStresses(depth,unit_weight,PP_profile,gamma_w):
     """
     Arguments:
@@ -47,7 +115,7 @@ def soilStresses(depth,unit_weight,PP_profile,gamma_w):
     a2 = depth[1:] - depth[:-1] 
     delta_z = np.append(a1,a2)               # Calculate layer delta_z
     layer_weight = delta_z * unit_weight     # Calculate delta_gamma
-    sigma_t = np.cumsum(layer_weight)   # Calculate Total Stress
+    sigma_t = prec.wideCumsum(layer_weight)   # Calculate Total Stress (accumulated in float64)
     
     ### Pore Pressure Calculation
     pore_pressure = (depth - PP_profile) * gamma_w
@@ -59,67 +127,167 @@ def soilStresses(depth,unit_weight,PP_profile,gamma_w):
     return np.stack((sigma_t , pore_pressure , sigma_e),axis=-1)
 
 
-def geoComputations(qt,fs,sigma_T,sigma_E,depth_arr,pa_atm):
+## Correlations shared by geoComputations, the derivedGraph nodes and the geoKernels
+#kernels. Each one fills out= in place when it is given (workspace buffers), otherwise
+#it returns a new array.
+#   net   = qt - sigma_T
+#   ratio = pa_atm / sigma_E
+
+def frictionRatio(fs, net, out=None):
+    """Normalized friction ratio Fr (%), 0.001 where Fr <= 0"""
+    Fr = np.divide(fs, net, out=out)
+    Fr *= 100
+    np.copyto(Fr, 0.001, where=Fr <= 0)
+    return Fr
+
+def normalizedTip(net, pa_atm, Cn, out=None):
+    """Normalized tip resistance (net/pa_atm) * Cn, 0.01 where negative"""
+    Qt = np.divide(net, pa_atm, out=out)
+    Qt *= Cn
+    np.copyto(Qt, 0.01, where=Qt < 0)
+    return Qt
+
+def stressNormalization(ratio, n, out=None):
+    """Cn = ratio**n capped at 1.7"""
+    Cn = np.power(ratio, n, out=out)
+    return np.minimum(Cn, 1.7, out=Cn)
+
+def frictionTerm(Fr, out=None):
+    """(1.22 + log10(Fr))**2, the Fr part of Ic (does not change with n)"""
+    term = np.log10(Fr, out=out)
+    term += 1.22
+    return np.square(term, out=term)
+
+def behaviourIndex(Qt, Fr_term, out=None):
+    """Soil behaviour type index Ic from Qt and frictionTerm(Fr)"""
+    Ic = np.log10(Qt, out=out)
+    np.subtract(3.47, Ic, out=Ic)
+    np.square(Ic, out=Ic)
+    Ic += Fr_term
+    return np.sqrt(Ic, out=Ic)
+
+def frictionAngle(qt, net, sigma_E, ratio, pa_atm, out=None, scratch=None):
+    """Friction angle (deg), maximum of Kulhawy & Mayne (1990) and Robertson & Campanella (1983)"""
+    Cn = np.sqrt(ratio, out=out)                              # Explicitly using exponent factor of 0.5 for sands
+    f_angle_KW_1990 = normalizedTip(net, pa_atm, Cn, out=scratch)
+    np.log10(f_angle_KW_1990, out=f_angle_KW_1990)
+    f_angle_KW_1990 *= 11
+    f_angle_KW_1990 += 17.6                                   # Kulhawy & Mayne (1990)
+    f_angle_RB_1983 = np.divide(qt, sigma_E, out=Cn)
+    np.log10(f_angle_RB_1983, out=f_angle_RB_1983)
+    f_angle_RB_1983 += 0.29
+    f_angle_RB_1983 *= 1 / 2.68
+    np.arctan(f_angle_RB_1983, out=f_angle_RB_1983)
+    np.degrees(f_angle_RB_1983, out=f_angle_RB_1983)          # Robertson & Campanella (1983)
+    return np.maximum(f_angle_KW_1990, f_angle_RB_1983, out=f_angle_RB_1983)
+
+
+def geoComputations(qt,fs,sigma_T,sigma_E,depth_arr,pa_atm,return_iter_info=False):
+    """
+    Arguments:
+    qt, fs           : np.array
+                       Corrected tip resistance and sleeve friction (kPa)
+    sigma_T, sigma_E : np.array
+                       Total and effective vertical stresses (kPa)
+    depth_arr        : np.array
+                       CPT depth Array. Kept for backwards compatibility, the
+                       non-converged points are now reported through the flags below.
+    pa_atm           : float
+    return_iter_info : bool
+                       If True also return the iteration counts and convergence
+                       flags from Ic_iteration_vectorized.
+    
+    Returns:
+        2D np.array with 7 columns: Fr, Qt_1, Ic_o, n_iter, Qt_n, Ic_n, Friction Angle
+        (n_count, converged) are appended as a tuple when return_iter_info is True
+    """
+    net = qt - sigma_T
+    ratio = pa_atm/sigma_E
     
     #Normalized Friction Ratio
-    Fr = (fs/(qt-sigma_T) ) * 100
-    Fr = np.where( Fr <= 0 , 0.001 , Fr)
+    Fr = frictionRatio(fs, net)
+    Fr_term = frictionTerm(Fr)
         
     #Normalized Tip resistance n=1
-    Qt_1 = (qt - sigma_T)/pa_atm * (pa_atm/sigma_E) ** 1
-    Qt_1 = np.where( Qt_1 < 0 , 0.01 , Qt_1)
+    Qt_1 = normalizedTip(net, pa_atm, ratio)
     
     #Ic Calculations
-    Ic_o = ((3.47-np.log10(Qt_1))**2+(1.22+np.log10(Fr))**2)**0.5
-    n_o = np.minimum(0.381*Ic_o + 0.05*(sigma_E/pa_atm)-0.15,1)
-    n_o = np.maximum(n_o,0.35) #CHECK
-    Qt_n_o = np.array((qt - sigma_T)/pa_atm * (pa_atm/sigma_E)**n_o)
+    Ic_o = behaviourIndex(Qt_1, Fr_term)
     
     #Iteration for exponent n
-    arr_temp = np.stack((qt , sigma_T , sigma_E,Fr,depth_arr),axis=-1)
-    n_iter = np.apply_along_axis(func1d = Ic_iteration, axis = 1, arr = arr_temp , pa_atm = pa_atm)
+    n_iter, n_count, converged = Ic_iteration_vectorized(qt, sigma_T, sigma_E, Fr, pa_atm)
     
     #Qt_n and Ic calculations
-    Cn = np.minimum( (pa_atm/sigma_E)**n_iter, 1.7)     #
-    Qt_n = np.array((qt - sigma_T)/pa_atm * Cn)
-    Qt_n = np.where( Qt_n < 0 , 0.01 , Qt_n)
-    Ic_n = ((3.47-np.log10(Qt_n))**2+(1.22+np.log10(Fr))**2)**0.5
+    Qt_n = normalizedTip(net, pa_atm, stressNormalization(ratio, n_iter))
+    Ic_n = behaviourIndex(Qt_n, Fr_term)
     
     #Friction Angle Correlations
-    Qt_05 =   ((qt-sigma_T) / pa_atm) * (pa_atm/sigma_E)**0.5            # Explicitly using exponent factor of 0.5 for sands
-    Qt_05 = np.where( Qt_05 < 0 , 0.01 , Qt_05)
-    f_angle_KW_1990 = 17.6 + 11*np.log10(Qt_05) # Kulhawy & Mayne (1990)
-    f_angle_RB_1983 = np.degrees(np.arctan( (1 / 2.68) * (np.log10(qt/sigma_E) + 0.29)))
-    
-    #Stack Arrays and get maximum
-    f_angle = np.amax( np.stack( (f_angle_KW_1990,f_angle_RB_1983),axis = -1) , axis =1)
-    
-    return np.stack((Fr , Qt_1 , Ic_o, n_iter,Qt_n,Ic_n, f_angle),axis=-1)
-
-def Ic_iteration(cpt_array,pa_atm):
-           
-    n_calc = 1 
-    n_start = 0.9
-    count = 0
-    while abs(n_calc-n_start)>0.01: 
-        n_start = n_calc
-        Cn =  np.minimum((pa_atm/cpt_array[2])**n_start , 1.7) 
-        Qt_n = max( ((cpt_array[0] - cpt_array[1])/pa_atm)*Cn ,0.01)  #25
-        #Qt_n = max( ((cpt_array[0] - cpt_array[1])/pa_atm)*(pa_atm/cpt_array[2])**n_start ,0.01)
-        
-            # cpt_array[0] = qt_i
-            # cpt_array[1] = sigma_T_i
-            # cpt_array[2] = sigma_E_i
-            # cpt_array[3] = Fr_i
-        Ic_n = ( (3.47 - np.log10( Qt_n ) )**2 + (1.22 + np.log10( cpt_array[3] )) **2) **0.5
-        n_calc = 0.381*Ic_n + 0.05*(cpt_array[2]/pa_atm)-0.15
-        n_calc = np.clip(n_calc,0.35,1)
-        if count > 25:
-            print('Reached Max Iteration Step at',cpt_array[-1])  #Print Depth value
-            n_calc = np.nan
-            break
-        count+=1
-    
-    n_iter = n_calc
-    return n_iter     
+    f_angle = frictionAngle(qt, net, sigma_E, ratio, pa_atm)
+    
+    results = np.stack((Fr , Qt_1 , Ic_o, n_iter,Qt_n,Ic_n, f_angle),axis=-1)
+    if return_iter_info:
+        return results, n_count, converged
+    return results
 
+def Ic_iteration_vectorized(qt, sigma_T, sigma_E, Fr, pa_atm, tol=0.01, max_iter=25):
+    """
+    Fixed-point iteration of the stress exponent n (Robertson 2009) over whole arrays:
+    n = 0.381*Ic_n + 0.05*(sigma_E/pa_atm) - 0.15, clipped to [0.35, 1], starting
+    from n = 1. Only the points that have not converged yet are recomputed on each
+    pass (active mask).
+    
+    Arguments:
+    qt, sigma_T, sigma_E, Fr : np.array
+                               Arrays of the same shape (any number of dimensions)
+    pa_atm   : float
+    tol      : float
+               Convergence tolerance on |n_calc - n_start|
+    max_iter : int
+               Points still active after max_iter + 1 updates are flagged as
+               non-converged and set to np.nan
+    
+    Returns:
+        n_iter    : np.array with the stress exponent n
+        n_count   : np.array (int) with the number of updates per point
+        converged : np.array (bool), False where the iteration cap was reached
+                    or the inputs produce a non-finite n
+    """
+    qt, sigma_T, sigma_E, Fr = np.broadcast_arrays(qt, sigma_T, sigma_E, Fr)
+    shape = qt.shape
+    qt = qt.ravel()
+    sigma_T = sigma_T.ravel()
+    sigma_E = sigma_E.ravel()
+    Fr = Fr.ravel()
+    
+    dtype = np.result_type(qt, sigma_T, sigma_E, Fr, np.float32)
+    n_calc = np.ones(qt.size, dtype=dtype)
+    n_start = np.full(qt.size, 0.9, dtype=dtype)
+    n_count = np.zeros(qt.size, dtype=np.int64)
+    max_reached = np.zeros(qt.size, dtype=bool)
+    
+    #Terms that do not depend on n
+    log_Fr_term = frictionTerm(Fr)
+    
+    idx = np.flatnonzero(np.abs(n_calc - n_start) > tol)
+    while idx.size:
+        n_start[idx] = n_calc[idx]
+        sigma_E_i = sigma_E[idx]
+        
+        Cn = stressNormalization(pa_atm/sigma_E_i, n_start[idx])
+        Qt_n = np.maximum(((qt[idx] - sigma_T[idx])/pa_atm)*Cn, 0.01)
+        Ic_n = behaviourIndex(Qt_n, log_Fr_term[idx])
+        n_new = np.clip(0.381*Ic_n + 0.05*(sigma_E_i/pa_atm) - 0.15, 0.35, 1)
+        
+        #Points over the iteration cap are dropped with np.nan
+        over = n_count[idx] > max_iter
+        n_new[over] = np.nan
+        max_reached[idx[over]] = True
+        n_count[idx[~over]] += 1
+        n_calc[idx] = n_new
+        
+        #Keep only the points that are still moving (nan compares False)
+        still_active = ~over & (np.abs(n_new - n_start[idx]) > tol)
+        idx = idx[still_active]
+    
+    converged = ~max_reached & np.isfinite(n_calc)
+    return n_calc.reshape(shape), n_count.reshape(shape), converged.reshape(shape)
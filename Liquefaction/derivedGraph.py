@@ -0,0 +1,175 @@
+
+## LAZY DERIVED-COLUMN GRAPH
+#
+# Every derived quantity of the liquefaction pipeline is a node with its inputs
+# declared. Requesting a set of outputs computes only the nodes they depend on,
+# each one once (results are memoized in the graph). Ex. a screening run asking for
+# Sr_OS_2002 only needs qt and sigma_E and never runs the n or m iterations.
+#
+# Graph inputs: qt, fs, sigma_T, sigma_E (np.array, kPa), pa_atm and C_FC (float)
+
+import numpy as np
+
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+
+INPUTS = ('qt', 'fs', 'sigma_T', 'sigma_E', 'pa_atm', 'C_FC')
+
+#name -> (input names, function)
+NODES = {}
+
+
+def node(name, *inputs):
+    """Decorator registering a graph node"""
+    def register(func):
+        NODES[name] = (inputs, func)
+        return func
+    return register
+
+
+#Public output columns, same names and order as the main_rev2 output
+DERIVED_COLUMNS = ['Fr','Qt_1','Ic_o','n_iter','Qt_n','Ic_n','Friction Angle',
+                   'R10_K_factor','R10_Qt_n_cs','LSR_Rob_2010','Sr_Rob_2010',
+                   'LSR_OS_2002','Sr_OS_2002',
+                   'IB15_m_iter','IB15_qc1N_cs','IB15_LSR','IB15_LSR_void','IB15_Sr','IB15_Sr_void']
+
+
+## Geotechnical parameters (cptGeotech.geoComputations)
+#The correlations themselves are the shared helpers in cptGeotech_rev3
+
+@node('_net', 'qt', 'sigma_T')
+def _net(qt, sigma_T):
+    return qt - sigma_T
+
+@node('_ratio', 'pa_atm', 'sigma_E')
+def _ratio(pa_atm, sigma_E):
+    return pa_atm/sigma_E
+
+@node('Fr', 'fs', '_net')
+def _Fr(fs, net):
+    return cptGeotech.frictionRatio(fs, net)
+
+@node('_Fr_term', 'Fr')
+def _Fr_term(Fr):
+    return cptGeotech.frictionTerm(Fr)
+
+@node('Qt_1', '_net', 'pa_atm', '_ratio')
+def _Qt_1(net, pa_atm, ratio):
+    return cptGeotech.normalizedTip(net, pa_atm, ratio)
+
+@node('Ic_o', 'Qt_1', '_Fr_term')
+def _Ic_o(Qt_1, Fr_term):
+    return cptGeotech.behaviourIndex(Qt_1, Fr_term)
+
+@node('n_iter', 'qt', 'sigma_T', 'sigma_E', 'Fr', 'pa_atm')
+def _n_iter(qt, sigma_T, sigma_E, Fr, pa_atm):
+    return cptGeotech.Ic_iteration_vectorized(qt, sigma_T, sigma_E, Fr, pa_atm)[0]
+
+@node('Qt_n', '_net', 'pa_atm', '_ratio', 'n_iter')
+def _Qt_n(net, pa_atm, ratio, n_iter):
+    return cptGeotech.normalizedTip(net, pa_atm, cptGeotech.stressNormalization(ratio, n_iter))
+
+@node('Ic_n', 'Qt_n', '_Fr_term')
+def _Ic_n(Qt_n, Fr_term):
+    return cptGeotech.behaviourIndex(Qt_n, Fr_term)
+
+@node('Friction Angle', 'qt', '_net', 'sigma_E', '_ratio', 'pa_atm')
+def _friction_angle(qt, net, sigma_E, ratio, pa_atm):
+    return cptGeotech.frictionAngle(qt, net, sigma_E, ratio, pa_atm)
+
+
+## Residual strength methods (residualStrength.RS_METHODS)
+#One node per registered method, all sharing the same SharedTerms node so that
+#tan(phi), the stress normalizations and the m exponent are computed once.
+
+@node('_RS_terms', 'qt', 'sigma_E', 'pa_atm', 'C_FC')
+def _RS_terms(qt, sigma_E, pa_atm, C_FC):
+    return RS.SharedTerms(qt, sigma_E, pa_atm, C_FC=C_FC)
+
+#Graph inputs of each method and the SharedTerms attribute they are passed as
+_METHOD_INPUTS = {'OS_2002': (), 'Rob_2010': ('Qt_n', 'Ic_n', 'Friction Angle'),
+                  'IB_2015': ('Ic_n', 'Friction Angle')}
+_TERM_NAMES = {'Qt_n': 'Qt_n', 'Ic_n': 'Ic', 'Friction Angle': 'phi'}
+
+def _methodNode(method, inputs):
+    def evaluate(terms, *values):
+        terms.update(**{_TERM_NAMES[name]: value for name, value in zip(inputs, values)})
+        return RS.evaluateMethods(terms, [method])
+    return evaluate
+
+def _columnNode(col):
+    return lambda results: results[col]
+
+for _method, (_columns, _) in RS.RS_METHODS.items():
+    _inputs = _METHOD_INPUTS.get(_method, ('Qt_n', 'Ic_n', 'Friction Angle'))
+    node('_' + _method, '_RS_terms', *_inputs)(_methodNode(_method, _inputs))
+    for _col in _columns:
+        node(_col, '_' + _method)(_columnNode(_col))
+
+
+def requiredNodes(outputs):
+    """
+    Returns:
+        list with the nodes needed for outputs, in evaluation order
+    """
+    order = []
+    visiting = set()
+
+    def visit(name):
+        if name in INPUTS or name in order:
+            return
+        if name not in NODES:
+            raise KeyError('Unknown derived column: ' + str(name))
+        if name in visiting:
+            raise ValueError('Cycle in the derived-column graph at ' + name)
+        visiting.add(name)
+        for dep in NODES[name][0]:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in outputs:
+        visit(name)
+    return order
+
+
+class DerivedGraph:
+    """
+    Lazy evaluation of derived columns for one set of inputs.
+    Computed nodes are memoized, so successive requests reuse earlier results.
+
+    Arguments:
+    qt, fs, sigma_T, sigma_E : np.array (kPa)
+    pa_atm : float
+    C_FC   : float
+             Fines content fitting parameter for I&B 2015
+    """
+
+    def __init__(self, qt, fs, sigma_T, sigma_E, pa_atm, C_FC=0):
+        self.values = {'qt': qt, 'fs': fs, 'sigma_T': sigma_T, 'sigma_E': sigma_E,
+                       'pa_atm': pa_atm, 'C_FC': C_FC}
+
+    def get(self, name):
+        """Value of a single node, computing its dependencies as needed"""
+        for node_name in requiredNodes([name]):
+            if node_name not in self.values:
+                inputs, func = NODES[node_name]
+                self.values[node_name] = func(*[self.values[dep] for dep in inputs])
+        return self.values[name]
+
+    def compute(self, outputs=None):
+        """
+        Arguments:
+        outputs : list of str
+                  Derived columns to compute, None computes all DERIVED_COLUMNS
+
+        Returns:
+            dict  name -> np.array, in the requested order
+        """
+        if outputs is None:
+            outputs = DERIVED_COLUMNS
+        return {name: self.get(name) for name in outputs}
+
+    def computed(self):
+        """Names of the nodes evaluated so far"""
+        return [name for name in self.values if name not in INPUTS]
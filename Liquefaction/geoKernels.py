@@ -0,0 +1,157 @@
+
+## FUSED KERNELS WITH PREALLOCATED WORKSPACES
+#
+# Same results as cptGeotech.geoComputations and the residual strength functions,
+# but every long expression is evaluated in place with out= buffers instead of
+# building a new full-length temporary per operation. Scratch buffers live in a
+# GeoWorkspace that the caller reuses across soundings, and the results are written
+# straight into a preallocated output block (one contiguous column per output).
+# The correlations are the shared cptGeotech / residualStrength helpers called with out=.
+# Apart from boolean masks, only the n and m fixed-point iterations allocate, and only
+# for the points that are still iterating.
+
+import numpy as np
+
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+
+GEO_COLUMNS = ['Fr','Qt_1','Ic_o','n_iter','Qt_n','Ic_n','Friction Angle']
+RS_COLUMNS = ['R10_K_factor','R10_Qt_n_cs','LSR_Rob_2010','Sr_Rob_2010',
+              'LSR_OS_2002','Sr_OS_2002',
+              'IB15_m_iter','IB15_qc1N_cs','IB15_LSR','IB15_LSR_void','IB15_Sr','IB15_Sr_void']
+
+
+class GeoWorkspace:
+    """
+    Named scratch buffers and output blocks reused across soundings.
+    Buffers grow to the largest sounding seen and are never shrunk, so a batch of
+    soundings only allocates on the first (or a longer) sounding.
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self._buffers = {}
+
+    def buffer(self, name, n, dtype=None):
+        """1D scratch array of length n (contents undefined)"""
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape[0] < n or buf.dtype != dtype:
+            buf = np.empty(n, dtype=dtype)
+            self._buffers[name] = buf
+        return buf[:n]
+
+    def outputBlock(self, name, n, n_cols):
+        """(n x n_cols) output block with contiguous columns (Fortran order)"""
+        block = self._buffers.get(name)
+        if block is None or block.shape[0] < n or block.shape[1] != n_cols or block.dtype != self.dtype:
+            block = np.empty((n, n_cols), dtype=self.dtype, order='F')
+            self._buffers[name] = block
+        return block[:n]
+
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+
+def geoComputationsInto(qt, fs, sigma_T, sigma_E, pa_atm, ws, out=None):
+    """
+    Fused version of cptGeotech.geoComputations.
+
+    Arguments:
+    qt, fs, sigma_T, sigma_E : np.array (1D, same length)
+    pa_atm : float
+    ws     : GeoWorkspace
+    out    : np.array (n x 7)
+             Output block, columns as GEO_COLUMNS. Defaults to a workspace block
+             (overwritten by the next call with the same workspace).
+
+    Returns:
+        out
+    """
+    n = qt.shape[0]
+    if out is None:
+        out = ws.outputBlock('geo', n, len(GEO_COLUMNS))
+    Fr, Qt_1, Ic_o, n_iter, Qt_n, Ic_n, f_angle = [out[:, ii] for ii in range(len(GEO_COLUMNS))]
+
+    net = ws.buffer('net', n)                      # qt - sigma_T
+    ratio = ws.buffer('ratio', n)                  # pa_atm / sigma_E
+    fr_term = ws.buffer('fr_term', n)              # (1.22 + log10(Fr))**2
+    tmp = ws.buffer('tmp', n)
+
+    np.subtract(qt, sigma_T, out=net)
+    np.divide(pa_atm, sigma_E, out=ratio)
+
+    cptGeotech.frictionRatio(fs, net, out=Fr)
+    cptGeotech.frictionTerm(Fr, out=fr_term)
+    cptGeotech.normalizedTip(net, pa_atm, ratio, out=Qt_1)
+    cptGeotech.behaviourIndex(Qt_1, fr_term, out=Ic_o)
+
+    #Iteration for exponent n
+    n_iter[:] = cptGeotech.Ic_iteration_vectorized(qt, sigma_T, sigma_E, Fr, pa_atm)[0]
+
+    cptGeotech.normalizedTip(net, pa_atm, cptGeotech.stressNormalization(ratio, n_iter, out=tmp), out=Qt_n)
+    cptGeotech.behaviourIndex(Qt_n, fr_term, out=Ic_n)
+    cptGeotech.frictionAngle(qt, net, sigma_E, ratio, pa_atm, out=f_angle, scratch=tmp)
+
+    return out
+
+
+def residualStrengthsInto(qt, sigma_E, Qt_n, Ic_n, phi, pa_atm, ws, out=None, C_FC=0):
+    """
+    Fused version of the registered residual strength methods (same correlations from
+    residualStrength_rev2), including the Sr = LSR * sigma_E products.
+
+    Arguments:
+    qt, sigma_E, Qt_n, Ic_n, phi : np.array (1D, same length)
+    pa_atm : float
+    ws     : GeoWorkspace
+    out    : np.array (n x 12)
+             Output block, columns as RS_COLUMNS. Defaults to a workspace block.
+    C_FC   : float
+
+    Returns:
+        out
+    """
+    n = qt.shape[0]
+    if out is None:
+        out = ws.outputBlock('rs', n, len(RS_COLUMNS))
+    (K_factor, Qt_n_cs, LSR_Rob, Sr_Rob, LSR_OS, Sr_OS,
+     m_iter, qc1N_cs, LSR_IB, LSR_IB_void, Sr_IB, Sr_IB_void) = [out[:, ii] for ii in range(len(RS_COLUMNS))]
+
+    tan_phi = ws.buffer('tan_phi', n)
+    tmp = ws.buffer('tmp', n)
+    tmp2 = ws.buffer('tmp2', n)
+    FC = ws.buffer('FC', n)
+
+    RS.tanPhi(phi, out=tan_phi)
+
+    #Robertson 2010
+    RS.kFactorRob2010(Ic_n, out=K_factor, scratch=tmp)
+    np.multiply(K_factor, Qt_n, out=Qt_n_cs)
+    RS.lsrRob2010(Qt_n_cs, tan_phi, out=LSR_Rob, scratch=tmp)
+    np.multiply(LSR_Rob, sigma_E, out=Sr_Rob)
+
+    #Olson & Stark 2002
+    np.divide(sigma_E, pa_atm, out=tmp)
+    RS.lsrOS2002(qt, tmp, out=LSR_OS)
+    np.multiply(LSR_OS, sigma_E, out=Sr_OS)
+
+    #Idriss & Boulanger 2015
+    stress_ratio = ws.buffer('stress_ratio', n)   # pa_atm / sigma_E
+    qt_norm = ws.buffer('qt_norm', n)             # qt / pa_atm
+    np.divide(pa_atm, sigma_E, out=stress_ratio)
+    np.divide(qt, pa_atm, out=qt_norm)
+    RS.finesContent(Ic_n, C_FC, out=FC)
+    m_iter[:] = RS.iterate_m_factor(qt, sigma_E, FC, pa_atm, stress_ratio=stress_ratio, qt_norm=qt_norm)[0]
+    np.clip(m_iter, 0.264, 0.782, out=m_iter)
+
+    np.power(stress_ratio, m_iter, out=tmp)
+    np.minimum(tmp, 1.7, out=tmp)
+    tmp *= qt_norm                                 # qc1N
+    RS.cleanSandQc1N_IB2015(tmp, FC, out=qc1N_cs, scratch=tmp2)
+    RS.lsrIB2015(qc1N_cs, tan_phi, out=LSR_IB, voids_out=LSR_IB_void, scratch=tmp)
+
+    np.multiply(LSR_IB, sigma_E, out=Sr_IB)
+    np.multiply(LSR_IB_void, sigma_E, out=Sr_IB_void)
+
+    return out
@@ -0,0 +1,126 @@
+
+## PER-STAGE INSTRUMENTATION FOR THE PIPELINE
+#
+# A StageTimer records wall time, rows processed and peak allocated memory
+# (tracemalloc) for each stage of a sounding: parse, mapping, stresses, n iteration,
+# geo, each residual strength method, output writing, ...
+# A disabled timer hands out one shared no-op context manager, so leaving the
+# instrumentation calls in the pipeline costs next to nothing.
+#
+# Run reports (parallelRunner.runParallel with instrument=True) are exported with
+# writeRunReport and summarized with slowestFiles.
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+_NULL_STAGE = nullcontext()
+
+STAGE_FIELDS = ['file', 'stage', 'seconds', 'rows', 'peak_mb']
+
+
+class StageTimer:
+    """
+    Arguments:
+    enabled      : bool
+                   False makes stage() a no-op
+    trace_memory : bool
+                   Record the tracemalloc peak of every stage (started here if needed).
+                   tracemalloc itself slows down stages that allocate many Python objects.
+    """
+
+    def __init__(self, enabled=True, trace_memory=True):
+        self.enabled = enabled
+        self.trace_memory = trace_memory and enabled
+        self.records = []
+
+    def stage(self, name, rows=0):
+        """Context manager timing one stage: with timer.stage('mapping', n): ..."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._stage(name, rows)
+
+    @contextmanager
+    def _stage(self, name, rows):
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {'stage': name, 'seconds': time.perf_counter() - start, 'rows': int(rows),
+                      'peak_mb': None}
+            if self.trace_memory:
+                record['peak_mb'] = (tracemalloc.get_traced_memory()[1] - base) / 1024**2
+                if started_tracing:
+                    tracemalloc.stop()
+            self.records.append(record)
+
+
+#Shared disabled timer, used when no timer is passed
+NULL_TIMER = StageTimer(enabled=False)
+
+
+def reportRecords(report):
+    """
+    Flattens a runParallel report into one record per (file, stage)
+
+    Returns:
+        list of dicts with the STAGE_FIELDS keys
+    """
+    records = []
+    for entry in report:
+        for stage in entry.get('stages') or []:
+            records.append(dict(stage, file=entry['file']))
+    return records
+
+
+def writeRunReport(report, path):
+    """
+    Writes the stage records of a run as .json (full report, with errors and cache hits)
+    or .csv (one row per file and stage)
+    """
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+    elif path.endswith('.csv'):
+        pd.DataFrame(reportRecords(report), columns = STAGE_FIELDS).to_csv(path, index=False)
+    else:
+        raise ValueError('Run report must be a .json or .csv file')
+    return path
+
+
+def stageSummary(report):
+    """
+    Returns:
+        pd.DataFrame indexed by stage with the total and mean seconds, total rows and max peak MB
+    """
+    df = pd.DataFrame(reportRecords(report), columns = STAGE_FIELDS)
+    summary = df.groupby('stage', sort=False).agg(total_s = ('seconds', 'sum'), mean_s = ('seconds', 'mean'),
+                                                  rows = ('rows', 'sum'), max_peak_mb = ('peak_mb', 'max'))
+    return summary.sort_values('total_s', ascending=False)
+
+
+def slowestFiles(report, n=10):
+    """
+    Returns:
+        pd.DataFrame with the n slowest files: total seconds, rows, max peak MB and the
+        slowest stage of each file
+    """
+    df = pd.DataFrame(reportRecords(report), columns = STAGE_FIELDS)
+    if df.empty:
+        return pd.DataFrame(columns = ['total_s', 'rows', 'max_peak_mb', 'slowest_stage', 'slowest_stage_s'])
+    slowest = df.loc[df.groupby('file', sort=False)['seconds'].idxmax()].set_index('file')
+    files = df.groupby('file', sort=False).agg(total_s = ('seconds', 'sum'), rows = ('rows', 'max'),
+                                               max_peak_mb = ('peak_mb', 'max'))
+    files['slowest_stage'] = slowest['stage']
+    files['slowest_stage_s'] = slowest['seconds']
+    return files.sort_values('total_s', ascending=False).head(n)
@@ -2,6 +2,9 @@ import pandas as pd
 import numpy as np
 import os
 
+CPT_COLUMNS = ['Depth (m)','qc (MPa)','fs (MPa)','u2 (MPa)']
+
+
 def readCPTfile(path):
     """
     Arguments:
@@ -12,30 +15,89 @@ def readCPTfile(path):
         df : Dataframe with 4 columns
     """    
     
-    df = pd.read_csv(path,sep='\t',header=None,skiprows=7)
-    df = df.iloc[:,[0,4,5,3]].copy()   # Depth, qc , fs, u2
-    df.iloc[:,2:] = df.iloc[:,2:] / 1000   # Convert fs and u2 from kPa to MPa
-    df.columns = ['Depth (m)','qc (MPa)','fs (MPa)','u2 (MPa)']
-    return df
+    return pd.DataFrame(readCPTarray(path), columns = CPT_COLUMNS)
+
 
-def readSoilProfile():
+def readCPTarray(path, skiprows=7, chunksize=100000, dtype=np.float64):
+    """
+    Streaming reader for the tab-delimited CPT files. Only the Depth, U2, QC and FS
+    columns are parsed and each chunk is written straight into a typed buffer with
+    the kPa to MPa conversion of fs and u2 applied on the way in.
+    Extra trailing fields (ex. '91: Can not be pushed further') are ignored.
+    
+    Arguments:
+    path      : str
+                Location of CPT file to be analyzed.
+    skiprows  : int
+                Header lines to skip (same as readCPTfile)
+    chunksize : int
+                Rows parsed per chunk, bounds the parser memory on large files
+    dtype     : np.dtype
+                Output dtype
     
-    """For now this function returns a simple soil profile with two layers. 
-        Future version can read a .csv or text file or other user input """
+    Returns:
+        2D np.array with 4 columns: Depth (m), qc (MPa), fs (MPa), u2 (MPa)
+    """
+    # File columns: Depth, ROP, Feed force, U2, QC, FS, Friction Ratio
+    # usecols returns them in file order -> Depth, U2, QC, FS
+    order = [0, 2, 3, 1]                        # Depth, qc , fs, u2
+    scale = np.array([1, 1, 1/1000, 1/1000])    # Convert fs and u2 from kPa to MPa
+    
+    buffer = np.empty((chunksize, 4), dtype=dtype)
+    n_rows = 0
+    reader = pd.read_csv(path, sep='\t', header=None, skiprows=skiprows,
+                         usecols=[0,3,4,5], dtype=np.float64, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            values = chunk.to_numpy()
+            n_new = n_rows + len(values)
+            if n_new > len(buffer):
+                buffer = np.resize(buffer, (max(n_new, 2*len(buffer)), 4))
+            np.multiply(values[:, order], scale, out = buffer[n_rows:n_new], casting = 'unsafe')
+            n_rows = n_new
+    
+    return buffer[:n_rows]
+
+SOIL_PROFILE_COLUMNS = ['Layer Name','Top Depth','Total Unit Weight','GWT']
+
+
+def readSoilProfile(path=None):
+    
+    """Reads a soil profile from a .csv file with the columns
+        Layer Name, Top Depth, Total Unit Weight, GWT
+        Without a path it returns the default profile with three layers."""
+    
+    if path is not None:
+        soil = pd.read_csv(path, dtype = {'Layer Name': str, 'GWT': str})
+        return soil[SOIL_PROFILE_COLUMNS].sort_values('Top Depth', ignore_index=True)
        
     soil = pd.DataFrame( [['1',0,18,'gwt_1'],
                          ['2',10,18,'gwt_1'],
                          ['3',20,18,'gwt_1']],
-                        columns= ['Layer Name','Top Depth','Total Unit Weight','GWT'])  
+                        columns= SOIL_PROFILE_COLUMNS)  
     return soil
 
-def readGWT():
+
+def readSoilProfiles(path):
+    
+    """Reads one soil profile per sounding from a .csv file with the columns
+        Sounding, Layer Name, Top Depth, Total Unit Weight, GWT
+        Returns a dict  sounding name -> soil profile DataFrame """
     
-    """For now this function returns a single PWP profile 
-        Future version can read a .csv or text file or other user input """
+    soil = pd.read_csv(path, dtype = {'Sounding': str, 'Layer Name': str, 'GWT': str})
+    return {name: grp[SOIL_PROFILE_COLUMNS].sort_values('Top Depth', ignore_index=True)
+            for name, grp in soil.groupby('Sounding', sort=False)}
+
+
+def readGWT(path=None):
+    
+    """Reads the PWP profiles from a .csv file with the columns GWT_ID, Depth To.
+        Without a path it returns a single PWP profile """
+    
+    if path is not None:
+        pwpProfile = pd.read_csv(path, dtype = {'GWT_ID': str}, index_col = 'GWT_ID')
+        return pwpProfile[['Depth To']]
        
     pwpProfile = pd.DataFrame({'Depth To':0}, index = ['gwt_1'])
     pwpProfile.index.name = 'GWT_ID'
     return pwpProfile
-
-
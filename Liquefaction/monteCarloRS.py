@@ -0,0 +1,248 @@
+
+## MONTE CARLO RESIDUAL STRENGTH MODULE
+#
+# Runs geoComputations and the three residual strength methods over N random
+# realizations of the inputs. Realizations are laid out as (N x depth) arrays and
+# broadcast through the same kernels used for a single sounding, processed in
+# chunks of realizations so the intermediate arrays stay memory-bounded.
+# The percentiles are exact while every realization fits in max_bytes, above it they
+# are estimated from log-spaced histograms updated chunk by chunk (memory independent
+# of the number of realizations).
+#
+# Sampled inputs:
+#   unit weight : one normal factor per layer and realization,  gamma * (1 + cov * Z)
+#   GWT depth   : one normal value per GWT ID and realization,   depth + std * Z  (>= 0)
+#   a_n         : uniform per realization
+#   C_FC        : normal per realization (Idriss & Boulanger 2015 fines content fitting parameter)
+
+import numpy as np
+import pandas as pd
+
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+import precision as prec
+
+#Residual strength columns returned for each method
+MC_METHODS = ['Sr_Rob_2010', 'Sr_OS_2002', 'IB15_Sr']
+
+#Histograms of the streaming percentiles: log10(Sr) bins, values outside go to the first / last bin
+SR_LOG_RANGE = (-3, 5)              # 0.001 to 100000 kPa
+SR_BINS_PER_DECADE = 200            # Bin width 1.2 % of the value
+SR_BINS = (SR_LOG_RANGE[1] - SR_LOG_RANGE[0]) * SR_BINS_PER_DECADE
+SR_BIN_ERROR = 10 ** (1 / SR_BINS_PER_DECADE) - 1     # Relative width of one bin (1.16 %)
+DEFAULT_MAX_BYTES = 256 * 1024**2
+
+
+class SrHistogram:
+    """
+    Streaming percentiles of one (N x depth) quantity, one log-spaced histogram per depth.
+    Memory is depth x SR_BINS int32 counts whatever the number of realizations. Every order
+    statistic is estimated inside its own bin, so a percentile is within SR_BIN_ERROR (one
+    bin, 1.16 %) of np.nanpercentile when the values around it are inside SR_LOG_RANGE.
+    NaN values are ignored (as np.nanpercentile).
+    """
+
+    def __init__(self, n_depth):
+        self.counts = np.zeros((n_depth, SR_BINS), dtype=np.int32)
+
+    def add(self, values):
+        """values : (M x depth) np.array"""
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bins = (np.log10(values[valid]) - SR_LOG_RANGE[0]) * SR_BINS_PER_DECADE
+        bins = np.clip(np.nan_to_num(bins, nan=0.0, neginf=0.0), 0, SR_BINS - 1).astype(np.int64)   # Sr <= 0 in the first bin
+        depth_idx = np.nonzero(valid)[1]
+        self.counts += np.bincount(depth_idx * SR_BINS + bins, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def _orderStatistic(self, cum, rows, k):
+        """Estimate of the k-th smallest value (0-based) of each row, inside the bin holding it"""
+        bin_idx = (cum[rows] > k[:, None]).argmax(axis=1)
+        count = self.counts[rows, bin_idx]
+        below = cum[rows, bin_idx] - count
+        position = (k - below + 0.5) / count                    # Values spread evenly inside the bin
+        return 10.0 ** (SR_LOG_RANGE[0] + (bin_idx + position) / SR_BINS_PER_DECADE)
+
+    def percentiles(self, percentiles):
+        """
+        Same interpolation as np.percentile (linear between the two order statistics around
+        the rank), with each order statistic estimated inside its bin.
+
+        Returns:
+            (len(percentiles) x depth) np.array, NaN where a depth has no values
+        """
+        cum = np.cumsum(self.counts, axis=1)
+        total = cum[:, -1]
+        out = np.full((len(percentiles), len(total)), np.nan)
+        rows = np.flatnonzero(total > 0)
+        for ii, p in enumerate(percentiles):
+            rank = p / 100 * (total[rows] - 1)
+            lower = np.floor(rank)
+            upper = np.minimum(lower + 1, total[rows] - 1)
+            weight = rank - lower
+            out[ii, rows] = ((1 - weight) * self._orderStatistic(cum, rows, lower)
+                             + weight * self._orderStatistic(cum, rows, upper))
+        return out
+
+
+def _realizationsSr(depth, qc, fs, u2, layer_code, gwt_code, unit_weights, gwt_depths,
+                    a_n, C_FC, gamma_w, pa_atm):
+    """
+    Residual strengths for a chunk of M realizations.
+    unit_weights (M x layers), gwt_depths (M x GWT IDs), a_n and C_FC (M x 1), the rest (depth,)
+
+    Returns:
+        dict method -> (M x depth) np.array
+    """
+    unit_weight = unit_weights[:, layer_code]
+    gwt_depth = gwt_depths[:, gwt_code]
+
+    #Soil stresses, accumulated along depth for every realization
+    delta_z = np.diff(depth, prepend=0)
+    sigma_T = prec.wideCumsum(delta_z * unit_weight, axis=1)
+    pore_pressure = np.maximum((depth - gwt_depth) * gamma_w, 0)
+    sigma_E = sigma_T - pore_pressure
+
+    qt = qc + (1 - a_n) * u2
+    fs = np.where( fs <= 0 , 0.001 , fs)
+
+    geo = cptGeotech.geoComputations(qt, fs, sigma_T, sigma_E, depth, pa_atm)
+    Qt_n, Ic_n, f_angle = geo[..., 4], geo[..., 5], geo[..., 6]
+
+    terms = RS.SharedTerms(qt, sigma_E, pa_atm, Qt_n=Qt_n, Ic=Ic_n, phi=f_angle, C_FC=C_FC)
+    results = RS.evaluateMethods(terms, ['Rob_2010', 'OS_2002', 'IB_2015'])
+    return {method: results[method] for method in MC_METHODS}
+
+
+def monteCarloResidualStrength(cpt_array, soilProfile, gwt_levels, gamma_w, pa_atm,
+                               n_realizations=1000,
+                               cov_unit_weight=0.05,
+                               std_gwt=0.5,
+                               a_n_range=(0.75, 0.85),
+                               std_C_FC=0.29,
+                               percentiles=(10, 50, 90),
+                               chunk_size=None,
+                               seed=None,
+                               precision='float64',
+                               max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Arguments:
+    cpt_array       : np.array
+                      readCPTarray output (Depth, qc, fs, u2 in m and MPa)
+    soilProfile     : pd.DataFrame from readSoilProfile
+    gwt_levels      : pd.DataFrame from readGWT
+    gamma_w, pa_atm : float
+    n_realizations  : int
+    cov_unit_weight : float
+                      Coefficient of variation of the layer unit weights
+    std_gwt         : float
+                      Standard deviation of the GWT depths (m)
+    a_n_range       : (float, float)
+                      Bounds of the uniform distribution for a_n
+    std_C_FC        : float
+                      Standard deviation of C_FC (mean 0)
+    percentiles     : tuple
+                      Percentiles reported for every method
+    chunk_size      : int
+                      Realizations computed at a time. None targets about 2e6 values per array.
+    seed            : int
+                      Seed for np.random.default_rng
+    precision       : 'float64' or 'float32'
+                      Floating point type of the realization arrays
+    max_bytes       : int
+                      Memory for the exact percentiles. Keeping every realization takes
+                      12 * n_realizations * len(depth) bytes (3 methods, float32); when that
+                      exceeds max_bytes the percentiles are estimated with SrHistogram instead,
+                      which takes 3 * 4 * SR_BINS * len(depth) bytes (19.2 kB per depth)
+                      whatever n_realizations, within one bin (SR_BIN_ERROR, 1.16 %) of the
+                      exact percentile (see histogramCheck).
+                      On top of either, each chunk holds a few dozen arrays of
+                      chunk_size * len(depth) values.
+
+    Returns:
+        pd.DataFrame with 'Depth (m)' and one column per method and percentile (ex. 'Sr_OS_2002_P50')
+    """
+    cpt_array = prec.asPrecision(cpt_array, precision)
+    depth = cpt_array[:, 0]
+    qc = cpt_array[:, 1] * 1000             # MPa to kPa
+    fs = cpt_array[:, 2] * 1000
+    u2 = cpt_array[:, 3] * 1000
+    dtype = cpt_array.dtype
+    n_depth = depth.size
+
+    mapped, layer_table = cptGeotech.cptMapperTyped(depth, soilProfile, gwt_levels)
+    if (mapped['layer'] < 0).any():
+        raise ValueError('CPT depths outside of the soil profile')
+    layer_code = mapped['layer']
+    gwt_code = mapped['gwt']
+    layer_weights = layer_table['Total Unit Weight'].to_numpy(dtype=np.float64)
+    gwt_base = gwt_levels['Depth To'].to_numpy(dtype=np.float64)
+
+    rng = np.random.default_rng(seed)
+    if chunk_size is None:
+        chunk_size = max(1, 2_000_000 // max(n_depth, 1))
+
+    #Only the residual strengths are kept for every realization (float32 to halve the footprint),
+    #or only their histograms when that does not fit in max_bytes
+    exact = 4 * len(MC_METHODS) * n_realizations * n_depth <= max_bytes
+    if exact:
+        Sr_all = {method: np.empty((n_realizations, n_depth), dtype=np.float32) for method in MC_METHODS}
+    else:
+        Sr_all = {method: SrHistogram(n_depth) for method in MC_METHODS}
+
+    for start in range(0, n_realizations, chunk_size):
+        M = min(chunk_size, n_realizations - start)
+        unit_weights = layer_weights * np.maximum(1 + cov_unit_weight * rng.standard_normal((M, layer_weights.size)), 0.1)
+        gwt_depths = np.maximum(gwt_base + std_gwt * rng.standard_normal((M, gwt_base.size)), 0)
+        a_n = rng.uniform(a_n_range[0], a_n_range[1], (M, 1))
+        C_FC = std_C_FC * rng.standard_normal((M, 1))
+        unit_weights, gwt_depths, a_n, C_FC = [arr.astype(dtype) for arr in (unit_weights, gwt_depths, a_n, C_FC)]
+
+        Sr = _realizationsSr(depth, qc, fs, u2, layer_code, gwt_code, unit_weights, gwt_depths,
+                             a_n, C_FC, gamma_w, pa_atm)
+        for method in MC_METHODS:
+            if exact:
+                Sr_all[method][start:start + M] = Sr[method]
+            else:
+                Sr_all[method].add(Sr[method])
+
+    results = {'Depth (m)': depth}
+    for method in MC_METHODS:
+        if exact:
+            values = np.nanpercentile(Sr_all[method], percentiles, axis=0)
+        else:
+            values = Sr_all[method].percentiles(percentiles)
+        for p, row in zip(percentiles, values):
+            results[method + '_P' + str(p)] = row
+    return pd.DataFrame(results)
+
+
+def histogramCheck(cpt_array, soilProfile, gwt_levels, gamma_w, pa_atm, n_realizations=500,
+                   percentiles=(1, 10, 50, 90, 99), seed=0, **kwargs):
+    """
+    Runs the same realizations with exact and with histogram percentiles and raises
+    AssertionError when they differ by more than SR_BIN_ERROR. Points where the exact
+    percentile is outside SR_LOG_RANGE are not compared.
+    Other arguments as monteCarloResidualStrength.
+
+    Returns:
+        pd.Series with the max relative deviation of every percentile column
+    """
+    run = lambda max_bytes: monteCarloResidualStrength(cpt_array, soilProfile, gwt_levels, gamma_w, pa_atm,
+                                                       n_realizations=n_realizations, percentiles=percentiles,
+                                                       seed=seed, max_bytes=max_bytes, **kwargs)
+    exact = run(np.inf)
+    binned = run(0)
+    deviation = {}
+    for col in exact.columns.drop('Depth (m)'):
+        ref = exact[col].to_numpy(dtype=np.float64)
+        est = binned[col].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            inside = (ref >= 10.0 ** SR_LOG_RANGE[0]) & (ref <= 10.0 ** SR_LOG_RANGE[1])
+        if (np.isnan(ref) != np.isnan(est)).any():
+            raise AssertionError(col + ': exact and histogram percentiles are NaN at different depths')
+        deviation[col] = np.max(np.abs(est[inside] - ref[inside]) / ref[inside], initial=0.0)
+    deviation = pd.Series(deviation)
+    if (deviation > SR_BIN_ERROR).any():
+        raise AssertionError('Histogram percentiles off by more than one bin:\n' + str(deviation[deviation > SR_BIN_ERROR]))
+    return deviation
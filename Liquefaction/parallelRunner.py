@@ -0,0 +1,240 @@
+
+## PARALLEL RUNNER FOR THE PER-FILE LIQUEFACTION PIPELINE
+#
+# Each CPT file is read, computed and returned by a worker process. The parent
+# process writes the outputs in the same order as the input file list, so the
+# run is reproducible regardless of which worker finishes first.
+# On Windows the calling script must guard the run with  if __name__ == '__main__':
+
+import os
+import logging
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import loading_CPT_and_profiles_rev2 as loadCPT
+import cptBatch
+import geoKernels
+import precision as prec
+import resultStore
+import resultCache
+import instrumentation
+
+logger = logging.getLogger(__name__)
+
+#Workspace of the fused kernels, one per dtype and process, reused by every file the process runs
+_WORKSPACES = {}
+
+
+def workerWorkspace(precision='float64'):
+    """geoKernels.GeoWorkspace of this process for the given precision"""
+    dtype = prec.resolveDtype(precision)
+    if dtype not in _WORKSPACES:
+        _WORKSPACES[dtype] = geoKernels.GeoWorkspace(dtype)
+    return _WORKSPACES[dtype]
+
+
+def processCPTfile(path, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, precision='float64', timer=None,
+                   workspace=None):
+    """
+    Runs the main_rev2 pipeline on a single CPT file.
+
+    Arguments:
+    timer     : instrumentation.StageTimer
+                Records the parse, compute (see cptBatch.computeBatch) and frame stages
+    workspace : geoKernels.GeoWorkspace
+                Use the fused kernels for the derived columns (see cptBatch.computeBatch)
+
+    Returns:
+        pd.DataFrame with the same columns as the main_rev2 output
+    """
+    if timer is None:
+        timer = instrumentation.NULL_TIMER
+    if soilProfile is None:
+        raise KeyError('No soil profile for ' + path)
+    with timer.stage('parse'):
+        cpt_data = loadCPT.readCPTarray(path)
+    if timer.enabled:
+        timer.records[-1]['rows'] = len(cpt_data)
+    columns, offsets, names = cptBatch.concatSoundings({cptBatch.soundingName(path): cpt_data})
+    results = cptBatch.computeBatch(columns, offsets, soilProfile, gwt_levels, a_n, gamma_w, pa_atm,
+                                    names, precision, timer=timer, workspace=workspace)
+    with timer.stage('frame', len(cpt_data)):
+        cpt_frame = pd.DataFrame(results)
+    return cpt_frame
+
+
+def outputPath(path, output_dir, output_format='csv'):
+    """Output file for a CPT file, ex. 'saudardalsstifla-2-CPT.txt' -> output_dir/CPT_2.csv"""
+    if output_format == 'npz':
+        return resultStore.partitionPath(output_dir, cptBatch.soundingName(path))
+    return os.path.join(output_dir, 'CPT_' + cptBatch.soundingName(path) + '.csv')
+
+
+def writeOutput(cpt_data, path, output_dir, output_format='csv'):
+    """
+    Writes the results of one CPT file as CSV (main_rev2 format) or as a
+    partition of the columnar result store ('npz', see resultStore)
+
+    Returns:
+        str with the output path
+    """
+    if output_format == 'npz':
+        return resultStore.writeSounding(output_dir, cptBatch.soundingName(path), cpt_data)
+    elif output_format == 'csv':
+        out_path = outputPath(path, output_dir)
+        cpt_data.to_csv(out_path)
+        return out_path
+    else:
+        raise ValueError('Output format must be csv or npz')
+
+
+def readOutput(out_path, columns=None):
+    """Reads back a file written by writeOutput"""
+    if out_path.endswith('.npz'):
+        return resultStore.readPartition(out_path, columns)
+    cpt_data = pd.read_csv(out_path, index_col=0)
+    return cpt_data if columns is None else cpt_data[list(columns)]
+
+
+def _processSafe(args):
+    """
+    Worker entry point. Errors are returned instead of raised so one bad file does not abort the run
+
+    Returns:
+        (pd.DataFrame or None, traceback or None, list of stage records)
+    """
+    path, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, precision, instrument, kernels = args
+    timer = instrumentation.StageTimer(trace_memory = instrument != 'time') if instrument else None
+    try:
+        workspace = workerWorkspace(precision) if kernels else None
+        cpt_data = processCPTfile(path, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, precision, timer,
+                                  workspace)
+        error = None
+    except Exception:
+        cpt_data, error = None, traceback.format_exc()
+    return cpt_data, error, (timer.records if instrument else [])
+
+
+def runParallel(files, output_dir, a_n, gamma_w, pa_atm, workers=None, chunksize=4,
+                soilProfile=None, gwt_levels=None, output_format='csv',
+                cache_dir=None, cache_max_bytes=resultCache.DEFAULT_MAX_BYTES, precision='float64',
+                instrument=False, kernels=False):
+    """
+    Arguments:
+    files       : list of str
+                  CPT files to be processed
+    output_dir  : str
+                  Folder for the CPT_<name>.csv outputs, created if missing
+    a_n, gamma_w, pa_atm : float
+    workers     : int
+                  Number of worker processes. None uses os.cpu_count(), 1 runs in this process.
+    chunksize   : int
+                  Number of files sent to a worker at a time
+    soilProfile : pd.DataFrame or dict
+                  Soil profile for every file or dict  sounding name -> profile
+                  (readSoilProfiles). Defaults to readSoilProfile()
+    gwt_levels  : pd.DataFrame
+                  Defaults to readGWT()
+    output_format : 'csv' or 'npz'
+                  'npz' writes one partition per sounding into the output_dir result store
+    cache_dir   : str
+                  Result cache folder (see resultCache). Files whose content, profiles
+                  and constants are unchanged are loaded from the cache instead of recomputed.
+                  None disables the cache.
+    cache_max_bytes : int
+                  Size limit of the cache, least recently used entries are evicted after the run
+    precision   : 'float64' or 'float32'
+                  Floating point type used end-to-end (see precision module)
+    instrument  : bool or 'time'
+                  Record wall time, rows and peak memory of every stage of every file
+                  (see instrumentation). Export with instrumentation.writeRunReport.
+                  Memory tracing slows down the Python-heavy stages (CSV writing),
+                  'time' records wall times and rows only.
+    kernels     : bool
+                  Compute the derived columns with the fused geoKernels, each worker process
+                  reusing one GeoWorkspace across its files (same results, less allocation)
+
+    Returns:
+        list of dicts (one per file, in input order) with keys 'file', 'output', 'rows', 'error', 'cached'
+        and 'stages' (list of stage records, empty unless instrument is True)
+    """
+    if soilProfile is None:
+        soilProfile = loadCPT.readSoilProfile()
+    if gwt_levels is None:
+        gwt_levels = loadCPT.readGWT()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    cptBatch.soundingPaths(files)              # Output files are named by sounding, no clashes
+    os.makedirs(output_dir, exist_ok=True)
+
+    def profileFor(path):
+        if isinstance(soilProfile, dict):
+            return soilProfile.get(cptBatch.soundingName(path))    # None is reported by the worker
+        return soilProfile
+
+    #Parent-side stages (cache lookup, writing), one timer per file
+    timers = {path: instrumentation.StageTimer(enabled = bool(instrument), trace_memory = instrument != 'time')
+              for path in files}
+
+    #Cache lookups happen here so only the misses are sent to the workers
+    keys = {}
+    cached = {}
+    if cache_dir is not None:
+        for path in files:
+            if profileFor(path) is None:
+                continue
+            with timers[path].stage('cache lookup'):
+                try:
+                    keys[path] = resultCache.cacheKey(path, profileFor(path), gwt_levels, a_n, gamma_w, pa_atm,
+                                                      precision)
+                except OSError:
+                    continue                  # Unreadable file, reported by the worker
+                hit = resultCache.cacheGet(cache_dir, keys[path])
+            if hit is not None:
+                cached[path] = hit
+
+    tasks = [(path, profileFor(path), gwt_levels, a_n, gamma_w, pa_atm, precision, instrument, kernels)
+             for path in files if path not in cached]
+
+    def computed():
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield _processSafe(task)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                #map yields results in input order
+                yield from pool.map(_processSafe, tasks, chunksize=chunksize)
+
+    report = []
+    results = computed()
+    for path in files:
+        entry = {'file': path, 'output': None, 'rows': 0, 'error': None, 'cached': path in cached, 'stages': []}
+        timer = timers[path]
+        if entry['cached']:
+            cpt_data = cached[path]
+        else:
+            cpt_data, entry['error'], entry['stages'] = next(results)
+        if entry['error'] is None:
+            try:
+                if not entry['cached'] and path in keys:
+                    with timer.stage('cache store', len(cpt_data)):
+                        resultCache.cachePut(cache_dir, keys[path], cpt_data)
+                with timer.stage('write', len(cpt_data)):
+                    entry['output'] = writeOutput(cpt_data, path, output_dir, output_format)
+                entry['rows'] = len(cpt_data)
+            except Exception:
+                entry['output'] = None
+                entry['error'] = traceback.format_exc()
+        #Stages in run order: cache lookup (parent), worker stages, cache store / write (parent)
+        lookup = [rec for rec in timer.records if rec['stage'] == 'cache lookup']
+        entry['stages'] = lookup + entry['stages'] + [rec for rec in timer.records if rec not in lookup]
+        if entry['error'] is not None:
+            logger.warning('Failed processing %s', path)
+        report.append(entry)
+
+    if cache_dir is not None:
+        resultCache.evict(cache_dir, cache_max_bytes)
+
+    return report
@@ -0,0 +1,69 @@
+
+## PRECISION POLICY FOR THE LIQUEFACTION PIPELINE
+#
+# The compute modules run end-to-end in one floating point type, float64 (default)
+# or float32. Inputs are cast once at the start of the pipeline and every kernel keeps
+# that type (Python float constants do not upcast arrays).
+# Running sums (total stress) are always accumulated in float64 and cast back,
+# so float32 mode does not drift on deep soundings.
+
+import numpy as np
+import pandas as pd
+
+PRECISIONS = {'float32': np.float32, 'float64': np.float64}
+
+
+def resolveDtype(precision='float64'):
+    """'float32' | 'float64' (or the numpy types) -> np.dtype"""
+    if isinstance(precision, str):
+        if precision not in PRECISIONS:
+            raise ValueError('Precision must be one of ' + str(list(PRECISIONS)))
+        return np.dtype(PRECISIONS[precision])
+    dtype = np.dtype(precision)
+    if dtype not in (np.dtype(np.float32), np.dtype(np.float64)):
+        raise ValueError('Precision must be float32 or float64')
+    return dtype
+
+
+def asPrecision(arr, precision='float64'):
+    """Casts to the policy dtype, without copying when it already matches"""
+    return np.asarray(arr, dtype=resolveDtype(precision))
+
+
+def wideCumsum(arr, axis=-1):
+    """Cumulative sum accumulated in float64 and returned in the input dtype"""
+    arr = np.asarray(arr)
+    return np.cumsum(arr, axis=axis, dtype=np.float64).astype(arr.dtype, copy=False)
+
+
+def accuracyReport(results, reference):
+    """
+    Compares two runs of the pipeline column by column, ex. float32 against float64.
+
+    Arguments:
+    results   : dict of np.array or pd.DataFrame
+    reference : dict of np.array or pd.DataFrame
+                Run used as reference (float64)
+
+    Returns:
+        pd.DataFrame indexed by column with the max absolute error, the max and 99th
+        percentile relative errors and the number of points where only one run is NaN
+    """
+    rows = {}
+    for col in reference.keys():
+        if col not in results.keys():
+            continue
+        ref = np.asarray(reference[col])
+        res = np.asarray(results[col])
+        if ref.dtype.kind != 'f':
+            continue
+        ref = ref.astype(np.float64)
+        res = res.astype(np.float64)
+        both = np.isfinite(ref) & np.isfinite(res)
+        abs_err = np.abs(res[both] - ref[both])
+        rel_err = abs_err / np.maximum(np.abs(ref[both]), np.finfo(np.float32).tiny)
+        rows[col] = {'max_abs_error': abs_err.max() if abs_err.size else 0.0,
+                     'max_rel_error': rel_err.max() if rel_err.size else 0.0,
+                     'p99_rel_error': np.percentile(rel_err, 99) if rel_err.size else 0.0,
+                     'nan_mismatch': int((np.isnan(ref) != np.isnan(res)).sum())}
+    return pd.DataFrame.from_dict(rows, orient='index')
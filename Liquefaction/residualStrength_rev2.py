@@ -1,105 +1,356 @@
 
 import numpy as np
-print('hola')
-#OLSON & STARK 2002
-def liqStrRatio_OS_2002(qt,sigma_E,pa_atm):
+
+########################################################################
+#METHOD REGISTRY
+#Every residual strength method is registered with the columns it returns and
+#receives a SharedTerms object instead of the raw arrays. Intermediates used by
+#several methods (stress normalizations, tan(phi), fines content, m exponent)
+#are computed the first time a method asks for them and reused by the others,
+#so evaluateMethods runs all registered methods in a single pass.
+
+RS_METHODS = {}     # name -> (columns, function)
+
+
+def registerMethod(name, columns):
+    """
+    Decorator adding a method to RS_METHODS. The function takes a SharedTerms
+    object and returns a tuple of arrays, one per column.
+    
+    ex. @registerMethod('My_2024', ['LSR_My_2024','Sr_My_2024'])
+        def my2024(t):
+            LSR = 0.03 + 0.01 * t['qt_norm']
+            return LSR, LSR * t.sigma_E
+    """
+    def register(func):
+        RS_METHODS[name] = (list(columns), func)
+        return func
+    return register
+
+
+class SharedTerms:
+    """
+    Inputs of the residual strength methods plus a cache of common intermediates.
+    Terms are read with  t['name']  and computed on first use (see _TERMS).
+    
+    Arguments:
+    qt, sigma_E : np.array
+    pa_atm      : float
+    Qt_n, Ic    : np.array
+                  Normalized tip resistance and soil behaviour type index (Rob. 2010, I&B 2015)
+    phi         : np.array
+                  Friction angle (deg), tan(phi) caps the LSR
+    C_FC        : float
+                  Fitting parameter for the fines content correlation (I&B 2015)
+    m_tol, m_max_iter : Convergence tolerance and iteration cap for the m exponent
+    """
+    
+    def __init__(self, qt, sigma_E, pa_atm, Qt_n=None, Ic=None, phi=None, C_FC=0,
+                 m_tol=0.001, m_max_iter=25):
+        self.qt = qt
+        self.sigma_E = sigma_E
+        self.pa_atm = pa_atm
+        self.Qt_n = Qt_n
+        self.Ic = Ic
+        self.phi = phi
+        self.C_FC = C_FC
+        self.m_tol = m_tol
+        self.m_max_iter = m_max_iter
+        self._cache = {}
+    
+    def update(self, **inputs):
+        """
+        Sets inputs. Cached terms are dropped only when an input that was already set
+        changes, setting a missing input (ex. phi after OS 2002 ran) keeps them.
+        """
+        for name, value in inputs.items():
+            old = getattr(self, name)
+            if old is not value:
+                setattr(self, name, value)
+                if old is not None:
+                    self._cache.clear()
+    
+    def __getitem__(self, name):
+        if name not in self._cache:
+            self._cache[name] = _TERMS[name](self)
+        return self._cache[name]
+
+
+_TERMS = {
+    'sigma_norm'   : lambda t: t.sigma_E / t.pa_atm,
+    'stress_ratio' : lambda t: t.pa_atm / t.sigma_E,
+    'qt_norm'      : lambda t: t.qt / t.pa_atm,
+    'tan_phi'      : lambda t: tanPhi(t.phi),
+    'FC'           : lambda t: finesContent(t.Ic, t.C_FC),
+    'm_solution'   : lambda t: iterate_m_factor(t.qt, t.sigma_E, t['FC'], t.pa_atm, t.m_tol, t.m_max_iter,
+                                                stress_ratio=t['stress_ratio'], qt_norm=t['qt_norm']),
+    'm_iter'       : lambda t: np.clip(t['m_solution'][0] ,  0.264 , 0.782),
+    'Cn_m'         : lambda t: np.clip(t['stress_ratio']**t['m_iter'], None, 1.7),
+}
+
+
+def methodColumns(methods=None):
+    """Output columns of the given methods (all registered methods by default), in order"""
+    if methods is None:
+        methods = list(RS_METHODS)
+    return [col for name in methods for col in RS_METHODS[name][0]]
+
+
+def evaluateMethods(terms, methods=None):
+    """
+    Arguments:
+    terms   : SharedTerms
+    methods : list of str
+              Registered method names, None runs all of them
     
-    #Equation [6] in Olson & Stark 2002
-    Cq = 1.8 / (0.8 + (sigma_E/pa_atm))    
-    qc1 = qt * Cq
-    qc1 = qc1 / 1000 # kPa to MPa
-    LSR_profile = 0.03 + 0.0143 * qc1
-    LSR_profile = np.where(qc1 > 6.5 , 0.4 , LSR_profile )
-       
+    Returns:
+        dict  column -> np.array for every column of the evaluated methods
+    """
+    if methods is None:
+        methods = list(RS_METHODS)
+    out = {}
+    for name in methods:
+        if name not in RS_METHODS:
+            raise KeyError('Unknown residual strength method: ' + str(name))
+        columns, func = RS_METHODS[name]
+        out.update(zip(columns, func(terms)))
+    return out
+
+
+########################################################################
+#CORRELATIONS
+#Shared by the registered methods and the geoKernels in-place kernels. out= (and
+#scratch=, a buffer of the same length) write into existing arrays, otherwise new
+#arrays are returned.
+
+def tanPhi(phi, out=None):
+    tan_phi = np.radians(phi, out=out)
+    return np.tan(tan_phi, out=tan_phi)
+
+def finesContent(Ic, C_FC=0, out=None):
+    """Fines content (%) from Ic, I&B 2015"""
+    FC = np.add(Ic, C_FC, out=out)
+    FC *= 80
+    FC -= 137
+    return np.clip(FC, 0, 100, out=FC)
+
+def lsrOS2002(qt, sigma_norm, out=None):
+    """Equation [6] in Olson & Stark 2002, sigma_norm = sigma_E / pa_atm"""
+    qc1 = np.add(0.8, sigma_norm, out=out)
+    np.divide(1.8, qc1, out=qc1)                # Cq
+    qc1 *= qt
+    qc1 /= 1000                                 # kPa to MPa
+    high = qc1 > 6.5
+    LSR_profile = np.multiply(qc1, 0.0143, out=qc1)
+    LSR_profile += 0.03
+    np.copyto(LSR_profile, 0.4, where=high)
     return LSR_profile
 
+def kFactorRob2010(Ic, out=None, scratch=None):
+    """Eqn [8] in Rob. 2010, 1.0 where Ic <= 1.64"""
+    K_factor = np.power(Ic, 3, out=out)
+    K_factor *= 5.581
+    term = np.power(Ic, 4, out=scratch)
+    term *= 0.403
+    K_factor -= term
+    np.square(Ic, out=term)
+    term *= 21.63
+    K_factor -= term
+    np.multiply(Ic, 33.75, out=term)
+    K_factor += term
+    K_factor -= 17.88
+    np.copyto(K_factor, 1.0, where=Ic <= 1.64)
+    return K_factor
+
+def lsrRob2010(Qt_n_cs, tan_phi, out=None, scratch=None):
+    """
+    Eqn [10] in Rob. 2010, 0.4 above Qt_n_cs = 70. Minimum 0.05 and capped at tan(phi)
+    where Qt_n_cs <= 70 (NaN Qt_n_cs gives 0.05)
+    """
+    cond1 = Qt_n_cs <= 70
+    cond2 = Qt_n_cs > 70
+    
+    den = np.multiply(Qt_n_cs, 0.02676, out=scratch)
+    np.subtract(1, den, out=den)
+    LSR_profile = np.square(Qt_n_cs, out=out)
+    LSR_profile *= 0.0001783
+    den += LSR_profile
+    np.multiply(Qt_n_cs, 0.0003124, out=LSR_profile)
+    np.subtract(0.02199, LSR_profile, out=LSR_profile)
+    LSR_profile /= den
+    np.copyto(LSR_profile, 0.4, where=cond2)
+    np.copyto(LSR_profile, 0.0, where=~(cond1 | cond2))
+    
+    #Set minimum to 0.05
+    np.copyto(LSR_profile, 0.05, where=LSR_profile < 0.05)
+    #Set max to tan(phi)
+    return np.minimum(LSR_profile, tan_phi, out=LSR_profile, where=cond1)
+
+def cleanSandQc1N_IB2015(qc1N, FC, out=None, scratch=None):
+    """qc1N_cs = qc1N + delta_qc1N_Sr, I&B 2015"""
+    delta_qc1N_Sr = np.square(FC, out=scratch)
+    delta_qc1N_Sr *= -0.007
+    qc1N_cs = np.multiply(FC, 1.2904, out=out)
+    delta_qc1N_Sr += qc1N_cs
+    delta_qc1N_Sr -= 2.4319
+    return np.add(qc1N, delta_qc1N_Sr, out=qc1N_cs)
+
+def lsrIB2015(qc1N_cs, tan_phi, out=None, voids_out=None, scratch=None):
+    """
+    Returns:
+        (LSR without voids, LSR with voids), both between 0.05 and min(tan(phi), 0.4)
+    """
+    LSR = np.divide(qc1N_cs, 24.5, out=voids_out)
+    term = np.divide(qc1N_cs, 61.7, out=scratch)
+    np.square(term, out=term)
+    LSR -= term
+    np.divide(qc1N_cs, 106, out=term)
+    np.power(term, 3, out=term)
+    LSR += term
+    LSR -= 4.42
+    np.exp(LSR, out=LSR)
+    
+    LSR_profile_no_voids = np.divide(qc1N_cs, 11.1, out=out)
+    LSR_profile_no_voids -= 9.82
+    np.exp(LSR_profile_no_voids, out=LSR_profile_no_voids)
+    LSR_profile_no_voids += 1
+    LSR_profile_no_voids *= LSR
+    
+    LSR_profile_voids = LSR
+    for LSR_profile in (LSR_profile_no_voids, LSR_profile_voids):
+        np.clip(LSR_profile, 0.05, tan_phi, out=LSR_profile)
+        np.minimum(LSR_profile, 0.4, out=LSR_profile)
+    return LSR_profile_no_voids, LSR_profile_voids
+
+
+########################################################################
+#OLSON & STARK 2002
+@registerMethod('OS_2002', ['LSR_OS_2002','Sr_OS_2002'])
+def _method_OS_2002(t):
+    LSR_profile = lsrOS2002(t.qt, t['sigma_norm'])
+    return LSR_profile, LSR_profile * t.sigma_E
+
+def liqStrRatio_OS_2002(qt,sigma_E,pa_atm):
+    return _method_OS_2002(SharedTerms(qt, sigma_E, pa_atm))[0]
+
 
 ########################################################################
 #Robertson 2010
 def cleanSandQtn_Rob2010(Qt_n,Ic):
-    f = lambda i : 5.581 * (i**3) - 0.403*(i**4) - 21.63*(i**2) + 33.75*i - 17.88  # Eqn [8] in Rob. 2010
-    K_factor = np.where(Ic<= 1.64, 1.0,f(Ic))
+    K_factor = kFactorRob2010(Ic)
     Qt_n_cs = K_factor * Qt_n                                                      # Eqn [6] in Rob. 2010
     return np.stack((K_factor , Qt_n_cs),axis=-1)
 
 #Liquefied Strength Ratio LSR
 def liqStrRatio_Rob2010(Qt_n_cs,phi):
-    
-    cond1 = Qt_n_cs <= 70  
-    cond2 = Qt_n_cs > 70     
-    condlist = [cond1, cond2]     
-    
-    f = lambda x : (0.02199 - 0.0003124*x) / (1 - 0.02676*x + 0.0001783* (x**2) )   # Eqn [10] in Rob. 2010
-    choicelist = [f(Qt_n_cs),0.4]
-            
-    LSR_profile = np.select(condlist , choicelist)
-    
-    #Set minimum to 0.05  
-    LSR_profile = np.where(LSR_profile<0.05,0.05, LSR_profile)
-    #Set max to tan(phi)
-    LSR_profile = np.where(cond1, np.minimum(LSR_profile,np.tan(np.radians(phi))), LSR_profile)
-    
-    return LSR_profile
+    return lsrRob2010(Qt_n_cs, tanPhi(phi))
+
+@registerMethod('Rob_2010', ['R10_K_factor','R10_Qt_n_cs','LSR_Rob_2010','Sr_Rob_2010'])
+def _method_Rob_2010(t):
+    rob = cleanSandQtn_Rob2010(t.Qt_n, t.Ic)
+    LSR_profile = lsrRob2010(rob[...,1], t['tan_phi'])
+    return rob[...,0], rob[...,1], LSR_profile, LSR_profile * t.sigma_E
 
 
 
 ########################################################################
-def liqStrRatio_IB_2015(Ic,qt,sigma_E,pa_atm,phi, C_FC=0):  #uSE TAN(PHI) COLUMN
-    
-    FC = 80*(Ic+C_FC)-137
-    FC = np.clip(FC , 0 , 100)
-                        
-    # Function for iteration to (m) exponent
-    def iterate_m_factor(arr, pa_atm):
-        """This function gets a 3 column array in the form of qt, sigma_E, and FC"""
-        #Array unpacking
-        qt,sigma_E,FC = arr
-       
-        #Initialize Iteration Variables
-        m_calc = 0.52
-        m = 0.5
-        count=0
-        while abs(m_calc-m)>0.001:
-            m = m_calc
-            Cn = min( (pa_atm/sigma_E)**m , 1.7)
-            qc1N = Cn * qt/pa_atm
-            delta_qc1N = (11.9 + qc1N/14.6) * np.exp(1.63 - (9.7 / (FC+2)) - (15.7 / (FC+2))**2)
-            qc1N_cs = qc1N + delta_qc1N
-            qc1N_cs = np.clip(qc1N_cs , 21 , 254)
-            m_calc = 1.338 - 0.249 * (qc1N_cs ) ** 0.264
-            
-            if count > 25:
-                print('Reached Max Iteration') 
-                m_calc = 0.5  #Could be set to np.nan
-                break
-            count+=1
-            return m_calc
+@registerMethod('IB_2015', ['IB15_m_iter','IB15_qc1N_cs','IB15_LSR','IB15_LSR_void','IB15_Sr','IB15_Sr_void'])
+def _method_IB_2015(t):
+    m_iter = t['m_iter']
+    qc1N = t['Cn_m'] * t['qt_norm']
+    qc1N_cs = cleanSandQc1N_IB2015(qc1N, t['FC'])
+    LSR_profile_no_voids, LSR_profile_voids = lsrIB2015(qc1N_cs, t['tan_phi'])
+    return (m_iter, qc1N_cs, LSR_profile_no_voids, LSR_profile_voids,
+            LSR_profile_no_voids * t.sigma_E, LSR_profile_voids * t.sigma_E)
+
+def liqStrRatio_IB_2015(Ic,qt,sigma_E,pa_atm,phi, C_FC=0, tol=0.001, max_iter=25, return_iter_info=False):  #uSE TAN(PHI) COLUMN
+    """
+    Arguments:
+    Ic, qt, sigma_E  : np.array
+    pa_atm           : float
+    phi              : np.array
+                       Friction angle (deg), tan(phi) caps the LSR
+    C_FC             : float
+                       Fitting parameter for the fines content correlation
+    tol, max_iter    : Convergence tolerance and iteration cap for the m exponent
+    return_iter_info : bool
+                       If True also return the iteration counts and convergence
+                       flags from iterate_m_factor.
+    
+    Returns:
+        2D np.array with 4 columns: m_iter, qc1N_cs, LSR (no voids), LSR (voids)
+        (m_count, converged) are appended as a tuple when return_iter_info is True
+    """
+    terms = SharedTerms(qt, sigma_E, pa_atm, Ic=Ic, phi=phi, C_FC=C_FC, m_tol=tol, m_max_iter=max_iter)
+    results = np.stack(_method_IB_2015(terms)[:4],axis=-1)
+    if return_iter_info:
+        _, m_count, converged = terms['m_solution']
+        return results, m_count, converged
+    return results
+
+
+def iterate_m_factor(qt, sigma_E, FC, pa_atm, tol=0.001, max_iter=25, stress_ratio=None, qt_norm=None):
+    """
+    Fixed-point iteration for the stress exponent (m) in Idriss & Boulanger 2015.
+    All points are solved together, only the ones that have not converged
+    yet are updated on each pass.
+    
+    Arguments:
+    qt, sigma_E, FC : np.array
+                      Arrays of the same shape (any number of dimensions)
+    pa_atm          : float
+    tol             : float
+                      Convergence tolerance on |m_calc - m|
+    max_iter        : int
+                      Points still active after max_iter + 1 updates are
+                      flagged as non-converged and set to m = 0.5
+    stress_ratio, qt_norm : np.array
+                      pa_atm/sigma_E and qt/pa_atm when the caller already has them
+                      (SharedTerms), computed here otherwise
+    
+    Returns:
+        m_iter    : np.array with the exponent m
+        m_count   : np.array (int) with the number of updates per point
+        converged : np.array (bool), False where the iteration cap was reached
+    """
+    if stress_ratio is None:
+        stress_ratio = pa_atm/sigma_E
+    if qt_norm is None:
+        qt_norm = qt/pa_atm
+    dtype = np.result_type(qt, sigma_E, FC, np.float32)
+    stress_ratio, qt_norm, FC = np.broadcast_arrays(stress_ratio, qt_norm, FC)
+    shape = FC.shape
+    stress_ratio = stress_ratio.ravel()
+    qt_norm = qt_norm.ravel()
+    FC = FC.ravel()
+    
+    m_calc = np.full(FC.size, 0.52, dtype=dtype)
+    m = np.full(FC.size, 0.5, dtype=dtype)
+    m_count = np.zeros(FC.size, dtype=np.int64)
+    converged = np.ones(FC.size, dtype=bool)
+    
+    #Terms that do not depend on m
+    FC_factor = np.exp(1.63 - (9.7 / (FC+2)) - (15.7 / (FC+2))**2)
+    
+    idx = np.flatnonzero(np.abs(m_calc - m) > tol)
+    while idx.size:
+        m[idx] = m_calc[idx]
+        Cn = np.minimum(stress_ratio[idx]**m[idx], 1.7)
+        qc1N = Cn * qt_norm[idx]
+        delta_qc1N = (11.9 + qc1N/14.6) * FC_factor[idx]
+        qc1N_cs = np.clip(qc1N + delta_qc1N, 21, 254)
+        m_new = 1.338 - 0.249 * qc1N_cs ** 0.264
+        
+        over = m_count[idx] > max_iter
+        m_new[over] = 0.5  #Could be set to np.nan
+        converged[idx[over]] = False
+        m_count[idx[~over]] += 1
+        m_calc[idx] = m_new
         
-    #Create Array for function application
-    arr_temp = np.stack((qt, sigma_E, FC),axis=-1)
-    
-    #Iteration Function loop
-    m_iter = np.apply_along_axis(func1d = iterate_m_factor, axis = 1, arr = arr_temp , pa_atm = pa_atm)
-    m_iter = np.clip(m_iter ,  0.264 , 0.782)
-    Cn = (pa_atm/sigma_E)**m_iter 
-    Cn = np.clip(Cn,None,1.7)
-    qc1N = Cn * qt/pa_atm
-    delta_qc1N_Sr = -0.007*(FC**2) + 1.2904*FC - 2.4319
-            
-            
-    qc1N_cs = qc1N + delta_qc1N_Sr   
-    
-    LSR = np.exp( (qc1N_cs / 24.5) - (qc1N_cs / 61.7)**2 + (qc1N_cs / 106)**3 - 4.42) 
-    LSR_profile_voids = np.clip(LSR, 0.05,np.tan(np.radians(phi)))
-    LSR_profile_no_voids = np.clip( LSR * (1 + np.exp( (qc1N_cs/11.1) - 9.82)), 
-                                0.05,
-                                np.tan(np.radians(phi)))
-    
-    LSR_profile_no_voids = np.where(LSR_profile_no_voids > 0.4, 0.4,  LSR_profile_no_voids )
-    LSR_profile_voids = np.where(LSR_profile_voids > 0.4, 0.4,  LSR_profile_voids )
-    print('hola')
-    print(LSR_profile_no_voids.max())
-    print(LSR_profile_voids.max())
-    return np.stack((m_iter , qc1N_cs , LSR_profile_no_voids, LSR_profile_voids),axis=-1)
+        #Keep only the points that are still moving
+        still_active = ~over & (np.abs(m_new - m[idx]) > tol)
+        idx = idx[still_active]
+    
+    return m_calc.reshape(shape), m_count.reshape(shape), converged.reshape(shape)
 
 
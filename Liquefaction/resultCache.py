@@ -0,0 +1,139 @@
+
+## CONTENT-ADDRESSED RESULT CACHE
+#
+# Results are cached on disk under a hash of everything that defines them:
+# the raw CPT file bytes, the soil and GWT profiles, the constants (a_n, gamma_w, pa_atm)
+# and the precision mode.
+# An unchanged sounding is loaded back instead of recomputed; any change in the file,
+# the profiles or the constants gives a new key.
+# Entries are resultStore partitions. The file modification time is used as the
+# last-access time for the size-based LRU eviction.
+#
+# Command line:
+#   python resultCache.py info <cache_dir>
+#   python resultCache.py invalidate <cache_dir> [key ...]
+
+import os
+import sys
+import glob
+import hashlib
+
+import resultStore
+
+#Bump when the pipeline changes in a way that makes old results stale
+CACHE_VERSION = '1'
+DEFAULT_MAX_BYTES = 2 * 1024**3
+
+
+def cacheKey(path, soilProfile, gwt_levels, a_n, gamma_w, pa_atm, precision='float64'):
+    """
+    Arguments:
+    path        : str
+                  Raw CPT file
+    soilProfile : pd.DataFrame from readSoilProfile
+    gwt_levels  : pd.DataFrame from readGWT
+    a_n, gamma_w, pa_atm : float
+    precision   : 'float64' or 'float32'
+
+    Returns:
+        str with the sha256 hex digest
+    """
+    h = hashlib.sha256()
+    h.update(('v' + CACHE_VERSION + '\n').encode())
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024**2), b''):
+            h.update(block)
+    h.update(b'\nsoil\n' + soilProfile.to_csv().encode())
+    h.update(b'\ngwt\n' + gwt_levels.to_csv().encode())
+    h.update(('\nconstants\n%r,%r,%r' % (float(a_n), float(gamma_w), float(pa_atm))).encode())
+    h.update(('\nprecision\n' + str(precision)).encode())
+    return h.hexdigest()
+
+
+def cacheGet(cache_dir, key, columns=None):
+    """
+    Returns:
+        pd.DataFrame with the cached results or None if the key is not in the cache
+    """
+    path = resultStore.partitionPath(cache_dir, key)
+    try:
+        cpt_data = resultStore.readPartition(path, columns)
+    except (OSError, ValueError, KeyError):    # Missing or unreadable entry
+        return None
+    os.utime(path)                             # Mark as recently used
+    return cpt_data
+
+
+def cachePut(cache_dir, key, cpt_data):
+    """Stores results under key, returns the entry path"""
+    return resultStore.writeSounding(cache_dir, key, cpt_data)
+
+
+def cacheEntries(cache_dir):
+    """
+    Returns:
+        list of (path, size in bytes, last access time) sorted from least to most recently used
+    """
+    entries = []
+    for path in glob.glob(os.path.join(cache_dir, 'CPT_*.npz')):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((path, stat.st_size, stat.st_mtime))
+    return sorted(entries, key = lambda entry: entry[2])
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Removes the least recently used entries until the cache is at most max_bytes
+
+    Returns:
+        int with the number of removed entries
+    """
+    entries = cacheEntries(cache_dir)
+    total = sum(entry[1] for entry in entries)
+    removed = 0
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate(cache_dir, keys=None):
+    """
+    Removes the given keys from the cache, or every entry when keys is None
+
+    Returns:
+        int with the number of removed entries
+    """
+    if keys is None:
+        paths = [entry[0] for entry in cacheEntries(cache_dir)]
+    else:
+        paths = [resultStore.partitionPath(cache_dir, key) for key in keys]
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+if __name__ == '__main__':
+
+    usage = 'usage: python resultCache.py (info | invalidate) <cache_dir> [key ...]'
+    if len(sys.argv) < 3 or sys.argv[1] not in ('info', 'invalidate'):
+        sys.exit(usage)
+
+    command, cache_dir, keys = sys.argv[1], sys.argv[2], sys.argv[3:]
+    if command == 'info':
+        entries = cacheEntries(cache_dir)
+        print(len(entries), 'entries,', round(sum(entry[1] for entry in entries) / 1024**2, 1), 'MB')
+    else:
+        print(invalidate(cache_dir, keys or None), 'entries removed')
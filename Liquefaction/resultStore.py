@@ -0,0 +1,115 @@
+
+## COLUMNAR RESULT STORE
+#
+# Results are stored as one .npz partition per sounding (CPT_<name>.npz) inside a
+# store folder. Every column is its own binary array in the partition, so reading
+# back a couple of columns only decompresses/loads those columns.
+# Adding soundings to a project only writes new partitions.
+
+import os
+import glob
+import numpy as np
+import pandas as pd
+
+_COLUMNS_KEY = '__columns__'
+
+
+def partitionPath(store_dir, name):
+    return os.path.join(store_dir, 'CPT_' + str(name) + '.npz')
+
+
+def writeSounding(store_dir, name, cpt_data, compress=False):
+    """
+    Arguments:
+    store_dir : str
+                Store folder (created if missing)
+    name      : str
+                Sounding name
+    cpt_data  : pd.DataFrame or dict of np.array
+                Results for one sounding, ex. parallelRunner.processCPTfile output
+    compress  : bool
+                Use np.savez_compressed (smaller files, slower writes)
+
+    Returns:
+        str with the partition path
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    columns = list(cpt_data.keys())
+    arrays = {}
+    for ii, col in enumerate(columns):
+        arr = np.asarray(cpt_data[col])
+        if arr.dtype == object:
+            arr = arr.astype(str)             # Layer names, GWT IDs
+        arrays['c%d' % ii] = arr
+    arrays[_COLUMNS_KEY] = np.array(columns, dtype=str)
+
+    path = partitionPath(store_dir, name)
+    tmp_path = path + '.tmp'
+    save = np.savez_compressed if compress else np.savez
+    with open(tmp_path, 'wb') as f:              # Write then rename so readers never see half a file
+        save(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def appendSoundings(store_dir, soundings, compress=False):
+    """
+    Adds (or replaces) partitions for a dict of  sounding name -> results
+
+    Returns:
+        list with the partition paths
+    """
+    return [writeSounding(store_dir, name, cpt_data, compress) for name, cpt_data in soundings.items()]
+
+
+def listSoundings(store_dir):
+    """Sounding names available in the store, sorted"""
+    files = glob.glob(os.path.join(store_dir, 'CPT_*.npz'))
+    return sorted(os.path.basename(f)[len('CPT_'):-len('.npz')] for f in files)
+
+
+def readPartition(path, columns=None):
+    """
+    Arguments:
+    path    : str
+              Partition file
+    columns : list of str
+              Columns to load, None loads all of them
+
+    Returns:
+        pd.DataFrame
+    """
+    with np.load(path, allow_pickle=False) as npz:
+        stored = list(npz[_COLUMNS_KEY])
+        if columns is None:
+            columns = stored
+        missing = [col for col in columns if col not in stored]
+        if missing:
+            raise KeyError('Columns not in ' + path + ': ' + str(missing))
+        data = {col: npz['c%d' % stored.index(col)] for col in columns}
+    return pd.DataFrame(data, columns = columns)
+
+
+def readSounding(store_dir, name, columns=None):
+    return readPartition(partitionPath(store_dir, name), columns)
+
+
+def readStore(store_dir, columns=None, soundings=None):
+    """
+    Arguments:
+    store_dir : str
+    columns   : list of str
+                Columns to load, None loads all of them
+    soundings : list of str
+                Soundings to load, None loads all of them
+
+    Returns:
+        pd.DataFrame with a (CPT, index) MultiIndex, same layout as the compiled CPT files
+    """
+    if soundings is None:
+        soundings = listSoundings(store_dir)
+    frames = [readSounding(store_dir, name, columns) for name in soundings]
+    if not frames:
+        return pd.DataFrame(columns = columns)
+    df = pd.concat(frames, keys = soundings, names = ['CPT', None])
+    return df
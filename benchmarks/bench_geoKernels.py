@@ -0,0 +1,113 @@
+
+## BENCHMARK - FUSED GEO KERNELS AGAINST THE ARRAY EXPRESSIONS
+#
+# Runs geoComputations + the residual strength functions and the geoKernels versions
+# (one GeoWorkspace reused across soundings) over a batch of synthetic soundings,
+# and reports the wall time and the tracemalloc peak per sounding. Before timing, it
+# checks that geoComputations, derivedGraph and geoKernels give the same columns.
+#
+#   python benchmarks/bench_geoKernels.py [rows per sounding] [soundings]
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Liquefaction'))
+
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+import derivedGraph
+import geoKernels
+
+PA_ATM = 101.325
+
+
+def syntheticSounding(n_rows, seed=0):
+    """Smooth stress profile with noisy qt / fs, in kPa"""
+    rng = np.random.default_rng(seed)
+    depth = np.linspace(0.02, 0.02 * n_rows, n_rows)
+    sigma_T = 18.5 * depth
+    sigma_E = np.maximum(sigma_T - 9.81 * np.maximum(depth - 1.0, 0), 1.0)
+    qt = np.abs(rng.lognormal(np.log(2000), 0.8, n_rows)) + sigma_T + 50
+    fs = np.abs(rng.lognormal(np.log(30), 0.7, n_rows))
+    return qt, fs, sigma_T, sigma_E, depth
+
+
+def runArrays(qt, fs, sigma_T, sigma_E, depth):
+    geo = cptGeotech.geoComputations(qt, fs, sigma_T, sigma_E, depth, PA_ATM)
+    Qt_n, Ic_n, f_angle = geo[:,4], geo[:,5], geo[:,6]
+    rob = RS.cleanSandQtn_Rob2010(Qt_n, Ic_n)
+    LSR_Rob = RS.liqStrRatio_Rob2010(rob[:,1], f_angle)
+    LSR_OS = RS.liqStrRatio_OS_2002(qt, sigma_E, PA_ATM)
+    ib = RS.liqStrRatio_IB_2015(Ic_n, qt, sigma_E, PA_ATM, f_angle)
+    return geo, rob, LSR_Rob * sigma_E, LSR_OS * sigma_E, ib, ib[:,2] * sigma_E, ib[:,3] * sigma_E
+
+
+def runKernels(qt, fs, sigma_T, sigma_E, depth, ws):
+    geo = geoKernels.geoComputationsInto(qt, fs, sigma_T, sigma_E, PA_ATM, ws)
+    return geoKernels.residualStrengthsInto(qt, sigma_E, geo[:,4], geo[:,5], geo[:,6], PA_ATM, ws)
+
+
+def checkAgreement(qt, fs, sigma_T, sigma_E, depth, rtol=1e-12):
+    """
+    Raises AssertionError when geoComputations + the residual strength functions,
+    DerivedGraph.compute and the geoKernels disagree on any column (NaN == NaN)
+    """
+    geo, rob, Sr_Rob, Sr_OS, ib, Sr_IB, Sr_IB_void = runArrays(qt, fs, sigma_T, sigma_E, depth)
+    arrays = dict(zip(geoKernels.GEO_COLUMNS, geo.T))
+    arrays.update({'R10_K_factor': rob[:,0], 'R10_Qt_n_cs': rob[:,1], 'Sr_Rob_2010': Sr_Rob,
+                   'Sr_OS_2002': Sr_OS, 'IB15_m_iter': ib[:,0], 'IB15_qc1N_cs': ib[:,1],
+                   'IB15_LSR': ib[:,2], 'IB15_LSR_void': ib[:,3],
+                   'IB15_Sr': Sr_IB, 'IB15_Sr_void': Sr_IB_void})
+
+    graph = derivedGraph.DerivedGraph(qt, fs, sigma_T, sigma_E, PA_ATM).compute()
+    ws = geoKernels.GeoWorkspace()
+    kernels = dict(zip(geoKernels.GEO_COLUMNS,
+                       geoKernels.geoComputationsInto(qt, fs, sigma_T, sigma_E, PA_ATM, ws).T.copy()))
+    kernels.update(zip(geoKernels.RS_COLUMNS,
+                       runKernels(qt, fs, sigma_T, sigma_E, depth, ws).T))
+
+    for col in derivedGraph.DERIVED_COLUMNS:
+        for name, other in (('derivedGraph', graph), ('geoKernels', kernels)):
+            if col in arrays:
+                np.testing.assert_allclose(other[col], arrays[col], rtol=rtol, atol=0, equal_nan=True,
+                                           err_msg=col + ': ' + name + ' against geoComputations')
+            elif name == 'geoKernels':
+                np.testing.assert_allclose(other[col], graph[col], rtol=rtol, atol=0, equal_nan=True,
+                                           err_msg=col + ': geoKernels against derivedGraph')
+
+
+def measure(func, soundings):
+    """Returns (seconds per sounding, peak traced MB per sounding)"""
+    func(*soundings[0])                              # Warm up (and size the workspace)
+    peaks = []
+    start = time.perf_counter()
+    for sounding in soundings:
+        tracemalloc.start()
+        func(*sounding)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    return elapsed / len(soundings), max(peaks) / 1024**2
+
+
+def main(n_rows=200000, n_soundings=10):
+    soundings = [syntheticSounding(n_rows, seed) for seed in range(n_soundings)]
+    ws = geoKernels.GeoWorkspace()
+    checkAgreement(*soundings[0])
+
+    t_arr, mem_arr = measure(runArrays, soundings)
+    t_ker, mem_ker = measure(lambda *args: runKernels(*args, ws), soundings)
+
+    print('%d soundings x %d rows' % (n_soundings, n_rows))
+    print('%-12s %12s %16s' % ('', 's/sounding', 'peak MB/sounding'))
+    print('%-12s %12.4f %16.1f' % ('arrays', t_arr, mem_arr))
+    print('%-12s %12.4f %16.1f' % ('geoKernels', t_ker, mem_ker))
+    print('workspace: %.1f MB (allocated once)' % (ws.nbytes() / 1024**2))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,65 @@
+
+## BENCHMARK - IMPORT TIME OF THE CPT MODULES
+#
+# Imports every module in a fresh interpreter (as a worker process or a CLI call
+# would) and reports the median wall time and which heavy optional packages were
+# pulled in. A module that cannot be imported at all (missing dependency) is reported.
+#
+#   python benchmarks/bench_imports.py [runs]
+
+import os
+import sys
+import json
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PATHS = [os.path.join(HERE, '..', 'Liquefaction'),
+         os.path.join(HERE, '..', 'Applications of Python in CPT Processing')]
+
+MODULES = ['loading_CPT_and_profiles_rev2', 'cptGeotech_rev3', 'residualStrength_rev2',
+           'cptBatch', 'parallelRunner', 'cli',
+           'processingCPT', 'RawCPT_processing', 'mappingSchemas', 'plottingCPT']
+
+HEAVY = ['plotly', 'geopandas', 'shapely', 'mapclassify', 'pyproj', 'matplotlib']
+
+_PROBE = '''
+import sys, time, json
+sys.path[:0] = %r
+start = time.perf_counter()
+try:
+    import %s
+    error = None
+except Exception as err:
+    error = '%%s: %%s' %% (type(err).__name__, err)
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'error': error,
+                  'heavy': [m for m in %r if m in sys.modules]}))
+'''
+
+
+def importTime(module, runs=5):
+    """
+    Returns:
+        dict with the median import time (s), the heavy packages loaded and the import error (or None)
+    """
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', _PROBE % (PATHS, module, HEAVY)],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = sorted(result['seconds'] for result in results)[len(results) // 2]
+    return {'seconds': seconds, 'heavy': results[-1]['heavy'], 'error': results[-1]['error']}
+
+
+def main(runs=5):
+    print('%-32s %10s  %s' % ('module', 'import ms', 'heavy packages loaded'))
+    for module in MODULES:
+        result = importTime(module, runs)
+        if result['error']:
+            print('%-32s %10s  %s' % (module, 'FAILED', result['error']))
+        else:
+            print('%-32s %10.1f  %s' % (module, result['seconds'] * 1000, ', '.join(result['heavy']) or '-'))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
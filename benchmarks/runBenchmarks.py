@@ -0,0 +1,220 @@
+
+## SCALING BENCHMARK SUITE
+#
+# Times the hot paths of the CPT modules on synthetic soundings (syntheticCPT) from
+# 1e3 to 1e7 rows and records the best wall time and the tracemalloc peak of each case.
+# Results can be stored as baselines and later runs are compared against them; a case
+# is flagged when it is slower / uses more memory than the baseline beyond the tolerances.
+# benchmarks/baselines.json holds the 1e3 .. 1e6 row numbers of the reference machine,
+# regenerate it with --save-baseline before comparing runs on other hardware.
+#
+#   python benchmarks/runBenchmarks.py                          # 1e3 .. 1e6 rows
+#   python benchmarks/runBenchmarks.py --sizes 1e3 1e5 1e7 --cases geoComputations filterCPT
+#   python benchmarks/runBenchmarks.py --save-baseline           # store the numbers
+#   python benchmarks/runBenchmarks.py --output after.json       # exit code 1 on regressions
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'Liquefaction'))
+sys.path.insert(1, os.path.join(HERE, '..', 'Applications of Python in CPT Processing'))
+
+import syntheticCPT
+import loading_CPT_and_profiles_rev2 as loadCPT
+import cptGeotech_rev3 as cptGeotech
+import residualStrength_rev2 as RS
+import processingCPT as filtering
+
+DEFAULT_SIZES = [10**3, 10**4, 10**5, 10**6]
+DEFAULT_BASELINE = os.path.join(HERE, 'baselines.json')
+GAMMA_W = 9.81
+PA_ATM = 101.325
+A_N = 0.8
+
+
+class Inputs:
+    """Synthetic sounding of n_rows plus every intermediate the cases start from"""
+
+    def __init__(self, n_rows, seed=0):
+        self.n_rows = n_rows
+        cpt, self.soilProfile, self.gwt_levels = syntheticCPT.syntheticSounding(n_rows, seed)
+        self.soilProfile = self.soilProfile[loadCPT.SOIL_PROFILE_COLUMNS]
+        self.cpt = cpt
+        self.depth = cpt['Depth (m)'].to_numpy()
+        qc = cpt['qc (MPa)'].to_numpy() * 1000
+        u2 = cpt['u2 (kPa)'].to_numpy()
+        self.fs = np.where(cpt['fs (kPa)'].to_numpy() <= 0, 0.001, cpt['fs (kPa)'].to_numpy())
+        self.qt = qc + (1 - A_N) * u2
+
+        mapped = cptGeotech.cptMapperTyped(self.depth, self.soilProfile, self.gwt_levels)[0]
+        self.unit_weight = mapped['unit_weight']
+        self.gwt_depth = mapped['gwt_depth']
+        stresses = cptGeotech.soilStresses(self.depth, self.unit_weight, self.gwt_depth, GAMMA_W)
+        self.sigma_T = stresses[:,0]
+        self.sigma_E = stresses[:,2]
+        geo = cptGeotech.geoComputations(self.qt, self.fs, self.sigma_T, self.sigma_E, self.depth, PA_ATM)
+        self.Qt_n, self.Ic_n, self.phi = geo[:,4], geo[:,5], geo[:,6]
+        self.elevation = 10.0 - self.depth
+        self._cpt_file = None
+
+    def cptFile(self, tmp_dir):
+        """Raw CPT file with this sounding (written once)"""
+        if self._cpt_file is None:
+            self._cpt_file = syntheticCPT.writeCPTfile(os.path.join(tmp_dir, 'synthetic-%d-CPT.txt' % self.n_rows),
+                                                       self.cpt)
+        return self._cpt_file
+
+    def segments(self, rows=1500):
+        """Sounding cut into soundings of rows rows (a compiled dataset): (offsets, depth in each sounding)"""
+        offsets = np.append(np.arange(0, self.n_rows, rows), self.n_rows)
+        depth = self.depth - np.repeat(self.depth[offsets[:-1]], np.diff(offsets)) + self.depth[0]
+        return offsets, depth
+
+    def terms(self):
+        return RS.SharedTerms(self.qt, self.sigma_E, PA_ATM, Qt_n=self.Qt_n, Ic=self.Ic_n, phi=self.phi)
+
+
+def _methodCase(method):
+    return lambda inp, tmp_dir: RS.evaluateMethods(inp.terms(), [method])
+
+
+#Case name -> function(inputs, tmp_dir)
+CASES = {
+    'readCPTfile'       : lambda inp, tmp_dir: loadCPT.readCPTfile(inp.cptFile(tmp_dir)),
+    'cptMapper'         : lambda inp, tmp_dir: cptGeotech.cptMapper(inp.depth, inp.soilProfile),
+    'cptMapperTyped'    : lambda inp, tmp_dir: cptGeotech.cptMapperTyped(inp.depth, inp.soilProfile, inp.gwt_levels),
+    'soilStresses'      : lambda inp, tmp_dir: cptGeotech.soilStresses(inp.depth, inp.unit_weight, inp.gwt_depth, GAMMA_W),
+    'geoComputations'   : lambda inp, tmp_dir: cptGeotech.geoComputations(inp.qt, inp.fs, inp.sigma_T, inp.sigma_E,
+                                                                          inp.depth, PA_ATM),
+    'filterCPT'         : lambda inp, tmp_dir: filtering.filterCPT(inp.qt, 'Rolling Median', 11),
+    'filterCPTcolumns'  : lambda inp, tmp_dir: filtering.filterCPTcolumns(np.column_stack([inp.qt, inp.fs]),
+                                                                          'Rolling Median', 11),
+    'filterCPT_settle3d': lambda inp, tmp_dir: filtering.filterCPT_settle3d(inp.qt, inp.depth, inp.elevation, 0.88),
+    'settle3dSegments'  : lambda inp, tmp_dir: filtering.settle3dMaskSegments(np.column_stack([inp.qt, inp.fs]),
+                                                                              inp.segments()[1], inp.segments()[0], 0.88),
+}
+for _method in RS.RS_METHODS:
+    CASES['RS ' + _method] = _methodCase(_method)
+CASES['RS all methods'] = lambda inp, tmp_dir: RS.evaluateMethods(inp.terms())
+
+
+def measure(func, repeat):
+    """
+    Returns:
+        (best wall time in s, tracemalloc peak in MB)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 1024**2
+
+
+def runSuite(sizes=DEFAULT_SIZES, cases=None, repeat=3):
+    """
+    Returns:
+        dict  case -> {str(rows): {'seconds': float, 'peak_mb': float} or {'error': str}}
+    """
+    cases = list(CASES) if cases is None else cases
+    results = {case: {} for case in cases}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in sizes:
+            inp = Inputs(n_rows)
+            n_repeat = repeat if n_rows < 10**6 else 1
+            for case in cases:
+                try:
+                    seconds, peak_mb = measure(lambda: CASES[case](inp, tmp_dir), n_repeat)
+                    results[case][str(n_rows)] = {'seconds': seconds, 'peak_mb': peak_mb}
+                except Exception as err:
+                    results[case][str(n_rows)] = {'error': '%s: %s' % (type(err).__name__, err)}
+                print('%-20s %10d  %s' % (case, n_rows, _fmt(results[case][str(n_rows)])), flush=True)
+            del inp
+    return results
+
+
+def _fmt(entry):
+    if 'error' in entry:
+        return 'ERROR ' + entry['error']
+    return '%10.4f s %10.1f MB' % (entry['seconds'], entry['peak_mb'])
+
+
+def compareBaseline(results, baseline, time_tol=0.25, memory_tol=0.10, min_seconds=0.005, min_mb=0.5):
+    """
+    Arguments:
+    results, baseline : runSuite outputs
+    time_tol, memory_tol : float
+                  Allowed relative increase before a case is flagged
+    min_seconds, min_mb  : float
+                  Absolute increases below these are treated as noise
+
+    Returns:
+        list of dicts with the flagged (case, rows, metric, baseline, current)
+    """
+    flagged = []
+    for case, by_size in results.items():
+        for rows, entry in by_size.items():
+            base = baseline.get(case, {}).get(rows)
+            if base is None or 'error' in base or 'error' in entry:
+                continue
+            for metric, tol, floor in (('seconds', time_tol, min_seconds), ('peak_mb', memory_tol, min_mb)):
+                if entry[metric] > base[metric] * (1 + tol) and entry[metric] - base[metric] > floor:
+                    flagged.append({'case': case, 'rows': int(rows), 'metric': metric,
+                                    'baseline': base[metric], 'current': entry[metric]})
+    return flagged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CPT scaling benchmarks')
+    parser.add_argument('--sizes', nargs='+', type=float, default=DEFAULT_SIZES,
+                        help='Rows per sounding, ex. 1e3 1e5 1e7')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=None)
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case (1 above 1e6 rows)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Merge the results into the baseline file instead of comparing')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--memory-tolerance', type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = runSuite([int(n) for n in args.sizes], args.cases, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        for case, by_size in results.items():
+            baseline.setdefault(case, {}).update(by_size)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Baseline saved to', args.baseline)
+        return 0
+
+    flagged = compareBaseline(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for item in flagged:
+        print('REGRESSION %(case)s @ %(rows)d rows: %(metric)s %(baseline).4g -> %(current).4g' % item)
+    if not baseline:
+        print('No baseline at', args.baseline, '(run with --save-baseline)')
+    return 1 if flagged else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
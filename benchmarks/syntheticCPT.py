@@ -0,0 +1,99 @@
+
+## SYNTHETIC CPT GENERATOR
+#
+# Realistic-looking soundings for the benchmarks: a layered profile of sand, silt and
+# clay units with depth-dependent tip resistance, sleeve friction and pore pressures
+# around a water table. Values use the same units as the raw CPT files
+# (qc in MPa, fs and u2 in kPa) and the soil / GWT tables match readSoilProfile and
+# readGWT, so every module can be fed directly.
+
+import numpy as np
+import pandas as pd
+
+#Soil type -> (qc at the surface (MPa), qc gradient (MPa/m), friction ratio (%), unit weight (kN/m3), u2 factor)
+SOIL_TYPES = {'sand': (6.0, 0.35, 0.6, 19.5, 1.0),
+              'silt': (2.0, 0.12, 2.0, 18.5, 2.5),
+              'clay': (0.5, 0.05, 4.0, 17.5, 6.0)}
+
+CPT_HEADER = ['%', 'Project ID\tsynthetic', 'Sounding ID\t%s', 'Zero values\t0 0 0 0 0 0', '#',
+              'Depth\tROP\tFeed force\tU2\tQC\tFS\tFriction Ratio']
+
+
+def syntheticProfile(max_depth, seed=0, thickness=(0.5, 6.0), gwt_depth=1.5):
+    """
+    Random layering down to max_depth.
+
+    Returns:
+        soilProfile : pd.DataFrame with the readSoilProfile columns (+ 'Soil Type')
+        gwt_levels  : pd.DataFrame with the readGWT layout
+    """
+    rng = np.random.default_rng(seed)
+    tops = [0.0]
+    while tops[-1] < max_depth:
+        tops.append(tops[-1] + rng.uniform(*thickness))
+    tops = np.round(tops[:-1], 2)
+    types = rng.choice(list(SOIL_TYPES), size=len(tops), p=[0.45, 0.25, 0.30])
+    soilProfile = pd.DataFrame({'Layer Name': [str(ii + 1) for ii in range(len(tops))],
+                                'Top Depth': tops,
+                                'Total Unit Weight': [SOIL_TYPES[t][3] for t in types],
+                                'GWT': 'gwt_1',
+                                'Soil Type': types})
+    gwt_levels = pd.DataFrame({'Depth To': [gwt_depth]}, index=pd.Index(['gwt_1'], name='GWT_ID'))
+    return soilProfile, gwt_levels
+
+
+def syntheticSounding(n_rows, seed=0, dz=0.01, gwt_depth=1.5, gamma_w=9.81):
+    """
+    Arguments:
+    n_rows    : int
+                Number of CPT readings
+    seed      : int
+    dz        : float
+                Depth increment (m)
+    gwt_depth : float
+                Water table depth (m)
+
+    Returns:
+        cpt_data    : pd.DataFrame with Depth (m), qc (MPa), fs (kPa), u2 (kPa)
+        soilProfile : pd.DataFrame
+        gwt_levels  : pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    depth = np.round(dz * np.arange(1, n_rows + 1), 4)
+    soilProfile, gwt_levels = syntheticProfile(depth[-1], seed, gwt_depth=gwt_depth)
+
+    code = np.searchsorted(soilProfile['Top Depth'].to_numpy(), depth, side='right') - 1
+    params = np.array([SOIL_TYPES[t] for t in soilProfile['Soil Type']])[code]
+    qc0, grad, rf, _, u_factor = params.T
+
+    #Correlated noise: log-normal scatter smoothed over ~10 readings
+    noise = rng.normal(0, 0.35, n_rows)
+    noise = np.convolve(noise, np.ones(10) / np.sqrt(10), mode='same')
+    trend_depth = np.minimum(depth, 60)                      # No unbounded growth on long runs
+    qc = (qc0 + grad * trend_depth) * np.exp(noise)
+    qc[:5] *= np.linspace(0.01, 1, min(5, n_rows))           # Penetration start
+
+    fs = qc * 1000 * rf / 100 * np.exp(rng.normal(0, 0.2, n_rows))
+    hydrostatic = np.maximum(depth - gwt_depth, 0) * gamma_w
+    u2 = hydrostatic * u_factor + rng.normal(0, 2, n_rows)
+
+    cpt_data = pd.DataFrame({'Depth (m)': depth, 'qc (MPa)': qc, 'fs (kPa)': fs, 'u2 (kPa)': u2})
+    return cpt_data, soilProfile, gwt_levels
+
+
+def writeCPTfile(path, cpt_data, sounding='1'):
+    """Writes a sounding in the raw tab-delimited format read by readCPTfile"""
+    depth = cpt_data['Depth (m)'].to_numpy()
+    qc = cpt_data['qc (MPa)'].to_numpy()
+    fs = cpt_data['fs (kPa)'].to_numpy()
+    raw = pd.DataFrame({'Depth': depth,
+                        'ROP': 20.0,
+                        'Feed force': np.round(qc * 0.8, 1),
+                        'U2': np.round(cpt_data['u2 (kPa)'].to_numpy(), 2),
+                        'QC': np.round(qc, 3),
+                        'FS': np.round(fs, 1),
+                        'Friction Ratio': np.round(np.where(qc > 0, fs / (qc * 10), 0), 1)})
+    with open(path, 'w', newline='') as f:
+        f.write('\r\n'.join(CPT_HEADER).replace('%s', str(sounding)) + '\r\n')
+        raw.to_csv(f, sep='\t', header=False, index=False, lineterminator='\r\n')
+    return path